@@ -0,0 +1,76 @@
+import argparse
+import random
+import time
+import chess
+import yet_another_ai as ai
+
+"""
+Benchmark of leaf evaluation throughput in the minimax engine, in leaves (positions evaluated) per second.
+Sibling positions are taken from random games. Each method evaluates every child of every sampled position:
+    evaluation: evaluation() on a python-chess board, one child at a time (push, evaluate, pop)
+    incremental: evaluation() on a SearchBoard, one child at a time, reading the incremental score
+    batch: evaluate_children(), all children of a position in one NumPy call (material and position only, no check terms)
+Usage: python bench_eval.py --positions 200
+"""
+
+def sample_positions(count, seed):
+    """
+    Play random games and keep count positions that have legal moves, as FENs.
+    """
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        board = chess.Board()
+        for ply in range(rng.randint(4, 80)):
+            moves = list(board.legal_moves)
+            if not moves:
+                break
+            board.push(rng.choice(moves))
+        if any(board.legal_moves):
+            positions.append(board.fen())
+    return positions
+
+def bench_evaluation(positions):
+    leaves = 0
+    start = time.time()
+    for fen in positions:
+        board = chess.Board(fen)
+        for move in list(board.legal_moves):
+            board.push(move)
+            ai.evaluation(board, True)
+            board.pop()
+            leaves += 1
+    return leaves, time.time() - start
+
+def bench_incremental(positions):
+    leaves = 0
+    start = time.time()
+    for fen in positions:
+        board = ai.SearchBoard(fen)
+        for move in list(board.legal_moves):
+            board.push(move)
+            ai.evaluation(board, True)
+            board.pop()
+            leaves += 1
+    return leaves, time.time() - start
+
+def bench_batch(positions):
+    leaves = 0
+    start = time.time()
+    for fen in positions:
+        board = ai.SearchBoard(fen)
+        moves = list(board.legal_moves)
+        ai.evaluate_children(board, moves)
+        leaves += len(moves)
+    return leaves, time.time() - start
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Leaf evaluation throughput of the minimax engine.')
+    parser.add_argument('--positions', type=int, default=200, help='number of parent positions to sample')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the random games')
+    args = parser.parse_args()
+
+    positions = sample_positions(args.positions, args.seed)
+    for name, bench in [('evaluation', bench_evaluation), ('incremental', bench_incremental), ('batch', bench_batch)]:
+        leaves, seconds = bench(positions)
+        print("%-12s %8d leaves %8.3f s %10.0f leaves/s" % (name, leaves, seconds, leaves / max(seconds, 1e-9)))
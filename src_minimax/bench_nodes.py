@@ -0,0 +1,52 @@
+import argparse
+import time
+import yet_another_ai as ai
+
+"""
+Node-count comparison of search features. Every position is searched by ai_move to a fixed depth, once with the given
+switches (module constants of yet_another_ai such as USE_PVS) turned off and once with them on, starting from empty
+tables each time. Fewer nodes at equal depth means a more efficient search.
+Usage: python bench_nodes.py --depth 4 --option USE_PVS USE_ASPIRATION
+"""
+
+POSITIONS = [
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+    "r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3",
+    "r1bqk2r/pppp1ppp/2n2n2/2b1p3/2B1P3/3P1N2/PPP2PPP/RNBQK2R w KQkq - 1 5",
+    "r3k2r/pp1n1ppp/2pbpn2/q7/3P4/2NBPN2/PP3PPP/R2QK2R w KQkq - 0 10",
+    "2r3k1/pp3ppp/2n1b3/3pP3/3P4/P1N2N2/1P3PPP/2R3K1 b - - 0 22",
+    "8/5pk1/6p1/3R4/6P1/5K2/r7/8 w - - 0 40",
+]
+
+def search(fen, depth):
+    ai.transposition_table.clear()
+    ai.move_ordering.clear()
+    board = ai.SearchBoard(fen)
+    start = time.time()
+    move = ai.ai_move(board, board.turn, time_limit=None, max_depth=depth)
+    return move, ai.search_control.nodes + ai.search_control.qnodes, time.time() - start
+
+def run(options, enabled, depth):
+    for option in options:
+        setattr(ai, option, enabled)
+    results = [search(fen, depth) for fen in POSITIONS]
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Node counts at fixed depth with search features off and on.')
+    parser.add_argument('--depth', type=int, default=4)
+    parser.add_argument('--option', type=str, nargs='+', default=['USE_PVS', 'USE_ASPIRATION'])
+    args = parser.parse_args()
+
+    ai.STORE_MIN_DEPTH = ai.MAX_DEPTH + 1 # keep the benchmark out of the database
+    ai.WARM_LOAD_ENTRIES = 0 # and the database out of the benchmark
+    ai.USE_BOOK = False # search the opening positions instead of answering from the book
+    off = run(args.option, False, args.depth)
+    on = run(args.option, True, args.depth)
+    print("%-72s %18s %18s %7s" % ('position', 'off: nodes move', 'on: nodes move', 'ratio'))
+    for fen, (move_off, nodes_off, time_off), (move_on, nodes_on, time_on) in zip(POSITIONS, off, on):
+        print("%-72s %10d %7s %10d %7s %7.2f" % (fen, nodes_off, move_off, nodes_on, move_on, nodes_on / float(nodes_off)))
+    total_off = sum(result[1] for result in off)
+    total_on = sum(result[1] for result in on)
+    print("total nodes: %d off, %d on (%.2f), time: %.2f s off, %.2f s on"
+          % (total_off, total_on, total_on / float(total_off), sum(r[2] for r in off), sum(r[2] for r in on)))
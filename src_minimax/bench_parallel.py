@@ -0,0 +1,48 @@
+import argparse
+import time
+import yet_another_ai as ai
+
+"""
+Speedup benchmark of the parallel root search. Every position is searched to a fixed depth by minimaxRoot and by
+minimaxRootParallel with 1, 2, 4 and 8 workers; the table starts empty for every search. Reports the time, the speedup
+over the serial search and whether the same move was found.
+Usage: python bench_parallel.py --depth 4 --workers 1 2 4 8
+"""
+
+POSITIONS = [
+    "r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3",
+    "r1bqk2r/pppp1ppp/2n2n2/2b1p3/2B1P3/3P1N2/PPP2PPP/RNBQK2R w KQkq - 1 5",
+    "r3k2r/pp1n1ppp/2pbpn2/q7/3P4/2NBPN2/PP3PPP/R2QK2R w KQkq - 0 10",
+    "8/5pk1/6p1/3R4/6P1/5K2/r7/8 w - - 0 40",
+]
+
+def search(fen, depth, workers):
+    ai.transposition_table.clear()
+    ai.move_ordering.clear()
+    ai.search_control.start()
+    board = ai.SearchBoard(fen)
+    start = time.time()
+    if workers is None:
+        move = ai.minimaxRoot(depth, board, True, board.turn)
+    else:
+        move = ai.minimaxRootParallel(depth, board, True, board.turn, workers=workers)
+    return move, time.time() - start
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Speedup of the parallel root search.')
+    parser.add_argument('--depth', type=int, default=4)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    ai.STORE_MIN_DEPTH = ai.MAX_DEPTH + 1 # keep the benchmark out of the database
+    ai.WARM_LOAD_ENTRIES = 0 # and the database out of the benchmark
+    for workers in args.workers:
+        ai.worker_pool(workers) # start the processes before timing
+    for fen in POSITIONS:
+        serial_move, serial_time = search(fen, args.depth, None)
+        print(fen)
+        print("    serial     %6.2f s  %s" % (serial_time, serial_move))
+        for workers in args.workers:
+            move, seconds = search(fen, args.depth, workers)
+            print("    %2d workers %6.2f s  %s  speedup %.2fx%s" % (workers, seconds, move, serial_time / seconds,
+                                                                   '' if move == serial_move else '  DIFFERENT MOVE'))
@@ -0,0 +1,129 @@
+import argparse
+import json
+import time
+import yet_another_ai as ai
+
+"""
+Search benchmark with regression tracking. Every position of a fixed set (openings, middlegame tactics, endgames,
+partly taken from the games of src/generate_data/sample.pgn) is searched by ai_search to a fixed depth and for a fixed
+time, from empty tables and without the opening book or the database. Nodes, time, NPS, best move and score are
+written to a JSON file; given the file of an earlier run, changes beyond a threshold are reported as regressions:
+more nodes, more time or lower NPS at fixed depth, a shallower depth or lower NPS at fixed time.
+Usage: python bench_search.py --depth 4 --time 1 --output bench.json --baseline previous.json --threshold 0.1
+"""
+
+POSITIONS = [
+    ('opening', "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"),
+    ('opening', "r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3"),
+    ('opening', "r2q1rk1/ppp1bppp/2n2n2/3p4/3P2b1/P2BPN2/1P3PPP/RNBQ1RK1 w - - 1 9"), # sample.pgn, game 1
+    ('opening', "rnbqk2r/1p2nppp/pb6/3p4/8/1N3N2/PPP1QPPP/R1B1KB1R w KQkq - 4 9"), # sample.pgn, game 2
+    ('middlegame', "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1"),
+    ('middlegame', "r3k2r/pp1n1ppp/2pbpn2/q7/3P4/2NBPN2/PP3PPP/R2QK2R w KQkq - 0 10"),
+    ('middlegame', "r2q2k1/n1p2pp1/1p1brn2/1P1pN1p1/p2P4/P1BQP2P/3N1PP1/1R3RK1 w - - 0 21"), # sample.pgn, game 1
+    ('middlegame', "r3r3/1p4p1/pqnk4/3p1Q2/8/1N6/PPP2PPP/2KbR3 w - - 1 21"), # sample.pgn, game 2
+    ('tactics', "r1b1kb1r/pppp1ppp/5q2/4n3/3KP3/2N3PN/PPP4P/R1BQ1B1R b kq - 0 1"),
+    ('tactics', "2r3k1/p4p2/3Rp2p/1p2P1pK/8/1P4P1/P3Q2P/1q6 b - - 0 1"),
+    ('endgame', "R7/2p1rpk1/1p3np1/1P6/2qP3P/5NP1/1Q3PK1/8 w - - 1 46"), # sample.pgn, game 1
+    ('endgame', "8/8/4k3/1p1pN3/1P1K4/2P3P1/5r1P/8 w - - 7 46"), # sample.pgn, game 2
+    ('endgame', "8/5pk1/6p1/3R4/6P1/5K2/r7/8 w - - 0 40"),
+    ('endgame', "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1"),
+]
+
+def search(fen, depth=None, time_limit=None):
+    """
+    Search one position from empty tables. Output: dictionary of the results.
+    """
+    ai.transposition_table.clear()
+    ai.move_ordering.clear()
+    board = ai.SearchBoard(fen)
+    move, statistics = ai.ai_search(board, board.turn, time_limit=time_limit, max_depth=depth or ai.MAX_DEPTH)
+    last = statistics.iterations[-1] if statistics.iterations else {'depth': 0, 'score': None}
+    return {'move': move.uci() if move else None, 'score': last['score'], 'depth': last['depth'],
+            'nodes': statistics.nodes + statistics.qnodes, 'seconds': statistics.seconds, 'nps': statistics.nps()}
+
+def run(depth, time_limit):
+    results = []
+    for category, fen in POSITIONS:
+        result = {'category': category, 'fen': fen}
+        if depth:
+            result['fixed_depth'] = search(fen, depth=depth)
+        if time_limit:
+            result['fixed_time'] = search(fen, time_limit=time_limit)
+        results.append(result)
+        print("%-10s %-72s %s" % (category, fen, '  '.join(
+            "%s: %s %s depth %d nodes %d %.2f s %d nps" % (kind, r['move'], r['score'], r['depth'], r['nodes'],
+                                                          r['seconds'], r['nps'])
+            for kind, r in ((kind, result[kind]) for kind in ('fixed_depth', 'fixed_time') if kind in result))))
+    return results
+
+def totals(results, kind):
+    entries = [result[kind] for result in results if kind in result]
+    nodes = sum(entry['nodes'] for entry in entries)
+    seconds = sum(entry['seconds'] for entry in entries)
+    return {'nodes': nodes, 'seconds': seconds, 'nps': nodes / seconds if seconds else 0.0,
+            'depth': sum(entry['depth'] for entry in entries)}
+
+def compare(report, baseline, threshold):
+    """
+    Output: list of regressions of report against baseline, as readable strings. Changed best moves are listed too
+    but are not regressions.
+    """
+    regressions = []
+    notes = []
+    previous = dict((result['fen'], result) for result in baseline['positions'])
+    checks = {'fixed_depth': [('nodes', 1), ('seconds', 1), ('nps', -1)], 'fixed_time': [('depth', -1), ('nps', -1)]}
+    for result in report['positions']:
+        old = previous.get(result['fen'])
+        if old is None:
+            continue
+        for kind, fields in checks.items():
+            if kind not in result or kind not in old:
+                continue
+            for field, direction in fields:
+                before, after = old[kind][field], result[kind][field]
+                if before and direction * (after - before) / float(before) > threshold:
+                    regressions.append("%s %s %s: %s -> %s" % (result['fen'], kind, field, before, after))
+            if result[kind]['move'] != old[kind]['move']:
+                notes.append("%s %s best move: %s -> %s" % (result['fen'], kind, old[kind]['move'], result[kind]['move']))
+    for kind, fields in checks.items():
+        if kind in report['totals'] and kind in baseline['totals']:
+            for field, direction in fields:
+                before, after = baseline['totals'][kind][field], report['totals'][kind][field]
+                if before and direction * (after - before) / float(before) > threshold:
+                    regressions.append("total %s %s: %s -> %s" % (kind, field, before, after))
+    for note in notes:
+        print(note)
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Fixed-position search benchmark with regression tracking.')
+    parser.add_argument('--depth', type=int, default=4, help='fixed depth of the first run, 0 to skip it')
+    parser.add_argument('--time', type=float, default=1.0, help='seconds per position of the second run, 0 to skip it')
+    parser.add_argument('--output', type=str, default='bench_search.json')
+    parser.add_argument('--baseline', type=str, default=None, help='results of an earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=0.1, help='relative change that counts as a regression')
+    args = parser.parse_args()
+
+    ai.STORE_MIN_DEPTH = ai.MAX_DEPTH + 1 # keep the benchmark out of the database
+    ai.WARM_LOAD_ENTRIES = 0 # and the database out of the benchmark
+    ai.USE_BOOK = False
+    results = run(args.depth, args.time)
+    report = {'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'depth': args.depth, 'time': args.time,
+              'positions': results,
+              'totals': dict((kind, totals(results, kind)) for kind in ('fixed_depth', 'fixed_time')
+                             if any(kind in result for result in results))}
+    for kind, total in sorted(report['totals'].items()):
+        print("%s: %d nodes, %.2f s, %d nps, total depth %d" % (kind, total['nodes'], total['seconds'], total['nps'],
+                                                               total['depth']))
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=1)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        for regression in regressions:
+            print("REGRESSION %s" % regression)
+        print("%d regressions over %d%%" % (len(regressions), args.threshold * 100))
+        if regressions:
+            raise SystemExit(1)
@@ -0,0 +1,268 @@
+import argparse
+import os
+import time
+import chess
+import numpy as np
+
+"""
+Endgame bitbases solved by retrograde analysis, for a lone king against a king and one or two pieces (KQK, KRK, KPK,
+KBNK).
+Every position of an ending gets a perfect index: side to move, then the square of an anchor piece reduced by the
+board's symmetries (the white king in the a1-d1-d4 triangle without pawns, the pawn on files a-d with one), then the
+squares of the other pieces. The result for the side to move is kept in two bit-packed arrays (won, lost; neither is a
+draw) and the distance to mate in plies in a byte array, so a probe is a few array reads. Tables are always built with
+white as the strong side; positions where black is strong are probed with the colours swapped.
+Endings that promote or capture into another table need that table first: KPK needs KQK and KRK.
+Usage: python bitbase.py KQK KRK KPK --directory bitbases
+"""
+
+BITBASE_DIR = 'bitbases'
+WIN = 1
+LOSS = 2
+DRAW = 3
+
+TRIANGLE = [chess.A1, chess.B1, chess.C1, chess.D1, chess.B2, chess.C2, chess.D2, chess.C3, chess.D3, chess.D4]
+PAWN_SQUARES = [square for square in chess.SQUARES if chess.square_file(square) < 4 and 1 <= chess.square_rank(square) <= 6]
+
+def _transform(flip_file, flip_rank, transpose):
+    squares = []
+    for square in chess.SQUARES:
+        file, rank = chess.square_file(square), chess.square_rank(square)
+        if transpose:
+            file, rank = rank, file
+        if flip_file:
+            file = 7 - file
+        if flip_rank:
+            rank = 7 - rank
+        squares.append(chess.square(file, rank))
+    return squares
+
+# square maps of the eight symmetries of the board, and of the file mirror that is the only one pawns allow
+SYMMETRIES = [_transform(flip_file, flip_rank, transpose)
+              for transpose in (False, True) for flip_rank in (False, True) for flip_file in (False, True)]
+PAWN_SYMMETRIES = SYMMETRIES[:2]
+
+def material(board):
+    """
+    Helper function: name of the ending (such as KQK), strong side first, and the strong colour.
+    None if the position is not a lone king against a king and pieces.
+    """
+    sides = []
+    for color in (chess.WHITE, chess.BLACK):
+        pieces = ''
+        for piece_type in (chess.QUEEN, chess.ROOK, chess.BISHOP, chess.KNIGHT, chess.PAWN):
+            pieces += chess.piece_symbol(piece_type).upper() * chess.popcount(board.pieces_mask(piece_type, color))
+        sides.append(pieces)
+    if sides[1] == '':
+        return 'K' + sides[0] + 'K', chess.WHITE
+    if sides[0] == '':
+        return 'K' + sides[1] + 'K', chess.BLACK
+    return None, None
+
+class Table(object):
+    """
+    One ending: its piece list, perfect index and, once generated or loaded, its results.
+    """
+    def __init__(self, name):
+        self.name = name
+        strong = name[1:name.index('K', 1)]
+        self.pieces = [chess.KING] + [chess.PIECE_SYMBOLS.index(symbol.lower()) for symbol in strong]
+        self.colors = [chess.WHITE] * len(self.pieces) + [chess.BLACK]
+        self.pieces.append(chess.KING)
+        if chess.PAWN in self.pieces:
+            self.anchor = self.pieces.index(chess.PAWN)
+            self.region = PAWN_SQUARES
+            self.symmetries = PAWN_SYMMETRIES
+        else:
+            self.anchor = 0
+            self.region = TRIANGLE
+            self.symmetries = SYMMETRIES
+        self.order = [self.anchor] + [i for i in range(len(self.pieces)) if i != self.anchor]
+        self.slot = [-1] * 64
+        for slot, square in enumerate(self.region):
+            self.slot[square] = slot
+        self.size = 2 * len(self.region) * 64 ** (len(self.pieces) - 1)
+        self.won = self.lost = self.dtm = None
+
+    def squares(self, board, strong):
+        """
+        Helper function: squares of the table's pieces in the position, with the colours swapped if black is strong.
+        """
+        squares = []
+        for piece_type, color in zip(self.pieces, self.colors):
+            mask = board.pieces_mask(piece_type, color if strong == chess.WHITE else not color)
+            square = chess.lsb(mask)
+            squares.append(square if strong == chess.WHITE else chess.square_mirror(square))
+        return squares
+
+    def index(self, squares, white_to_move):
+        """
+        Inputs: squares of the pieces (strong side white), side to move.
+        Output: perfect index of the position after reducing it by symmetry.
+        """
+        for symmetry in self.symmetries:
+            if self.slot[symmetry[squares[self.anchor]]] >= 0:
+                break
+        index = (0 if white_to_move else 1) * len(self.region) + self.slot[symmetry[squares[self.anchor]]]
+        for i in self.order[1:]:
+            index = index * 64 + symmetry[squares[i]]
+        return index
+
+    def board(self, index):
+        """
+        Output: the position with the given index, or None if it is not a legal position.
+        """
+        squares = [0] * len(self.pieces)
+        for i in reversed(self.order[1:]):
+            squares[i] = index % 64
+            index //= 64
+        squares[self.anchor] = self.region[index % len(self.region)]
+        if len(set(squares)) < len(squares):
+            return None
+        board = chess.Board(None)
+        for square, piece_type, color in zip(squares, self.pieces, self.colors):
+            board.set_piece_at(square, chess.Piece(piece_type, color))
+        board.turn = index < len(self.region)
+        return board if board.is_valid() else None
+
+    def result(self, index):
+        """
+        Output: (WIN, LOSS or DRAW for the side to move, distance to mate in plies).
+        """
+        byte, bit = index >> 3, 7 - (index & 7)
+        if (self.won[byte] >> bit) & 1:
+            return WIN, int(self.dtm[index])
+        if (self.lost[byte] >> bit) & 1:
+            return LOSS, int(self.dtm[index])
+        return DRAW, 0
+
+    def path(self, directory):
+        return os.path.join(directory, self.name + '.npz')
+
+    def load(self, directory):
+        arrays = np.load(self.path(directory))
+        self.won, self.lost, self.dtm = arrays['won'], arrays['lost'], arrays['dtm']
+
+    def save(self, directory):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        np.savez_compressed(self.path(directory), won=self.won, lost=self.lost, dtm=self.dtm)
+
+class Bitbases(object):
+    """
+    The tables found in a directory, loaded on first use.
+    """
+    def __init__(self, directory=BITBASE_DIR):
+        self.directory = directory
+        self.tables = {}
+
+    def table(self, name):
+        if name not in self.tables:
+            table = Table(name)
+            if os.path.exists(table.path(self.directory)):
+                table.load(self.directory)
+            else:
+                table = None
+            self.tables[name] = table
+        return self.tables[name]
+
+    def add(self, table):
+        self.tables[table.name] = table
+
+    def probe(self, board):
+        """
+        Output: (WIN, LOSS or DRAW for the side to move, distance to mate in plies), or None without a table.
+        The position must have no castling rights.
+        """
+        name, strong = material(board)
+        if name is None:
+            return None
+        table = self.table(name)
+        if table is None:
+            return None
+        return table.result(table.index(table.squares(board, strong), board.turn == strong))
+
+def generate(table, bitbases):
+    """
+    Retrograde analysis of one ending. Every legal position is expanded once into its successors: positions of the
+    same ending by their index, positions of other endings (captures, promotions) by the result probed from
+    bitbases. Mates and stalemates are decided first; then, ply by ply, a position is won in n if a successor is lost
+    in n-1, and lost if every successor is won, in one more than the longest of them. Whatever is left is a draw.
+    """
+    parents, children = [], []
+    exits = {} # (result, distance) of a successor in another ending -> node after the table's positions
+    value = np.zeros(table.size, dtype=np.int8)
+    dtm = np.zeros(table.size, dtype=np.int32)
+    moves = np.zeros(table.size, dtype=np.int32)
+    for index in range(table.size):
+        board = table.board(index)
+        if board is None:
+            continue
+        for move in board.legal_moves:
+            board.push(move)
+            name, strong = material(board)
+            if name == table.name:
+                child = table.index(table.squares(board, strong), board.turn == strong)
+            else:
+                if board.is_insufficient_material():
+                    outcome = (DRAW, 0)
+                else:
+                    outcome = bitbases.probe(board)
+                    if outcome is None:
+                        raise ValueError("%s needs the %s table" % (table.name, name))
+                child = table.size + exits.setdefault(outcome, len(exits))
+            board.pop()
+            parents.append(index)
+            children.append(child)
+            moves[index] += 1
+        if moves[index] == 0:
+            value[index] = LOSS if board.is_check() else DRAW
+
+    exit_outcomes = sorted(exits, key=exits.get)
+    value = np.concatenate([value, np.array([result for result, distance in exit_outcomes], dtype=np.int8)])
+    dtm = np.concatenate([dtm, np.array([distance for result, distance in exit_outcomes], dtype=np.int32)])
+    parents = np.array(parents, dtype=np.int64)
+    children = np.array(children, dtype=np.int64)
+    longest_exit = max([distance for result, distance in exit_outcomes] + [0])
+
+    n = 1
+    while True:
+        child_value = value[children]
+        child_dtm = dtm[children]
+        unknown = value[:table.size] == 0
+        mates = child_value == LOSS
+        won = unknown & (np.bincount(parents[mates & (child_dtm == n - 1)], minlength=table.size) > 0)
+        wins = np.bincount(parents[child_value == WIN], minlength=table.size)
+        lost = unknown & ~won & (moves > 0) & (wins == moves)
+        longest = np.zeros(table.size, dtype=np.int32)
+        np.maximum.at(longest, parents[child_value == WIN], child_dtm[child_value == WIN])
+        value[:table.size][won] = WIN
+        dtm[:table.size][won] = n
+        value[:table.size][lost] = LOSS
+        dtm[:table.size][lost] = longest[lost] + 1
+        if not won.any() and not lost.any() and n > longest_exit:
+            break
+        n += 1
+
+    value = value[:table.size]
+    table.won = np.packbits(value == WIN)
+    table.lost = np.packbits(value == LOSS)
+    table.dtm = np.where((value == WIN) | (value == LOSS), dtm[:table.size], 0).astype(np.uint8)
+    return table
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Generate endgame bitbases by retrograde analysis.')
+    parser.add_argument('tables', type=str, nargs='+', help='endings to generate, in order (KQK KRK KPK KBNK)')
+    parser.add_argument('--directory', type=str, default=BITBASE_DIR)
+    args = parser.parse_args()
+
+    bitbases = Bitbases(args.directory)
+    for name in args.tables:
+        start = time.time()
+        table = generate(Table(name), bitbases)
+        table.save(args.directory)
+        bitbases.add(table)
+        won = int(np.unpackbits(table.won).sum())
+        lost = int(np.unpackbits(table.lost).sum())
+        print("%s: %d positions, %d won, %d lost, longest mate %d plies, %.1f s"
+              % (name, table.size, won, lost, int(table.dtm.max()), time.time() - start))
@@ -0,0 +1,84 @@
+import argparse
+import collections
+import itertools
+import chess
+import chess.pgn
+import numpy as np
+import yet_another_ai as ai
+
+"""
+Opening book builder. Reads PGN files (such as the FICS games used by src/generate_data), follows every game up to a
+number of plies and counts, for each position reached, how often each move was played and how it scored for the side
+that played it. Moves by players under the Elo floor are skipped. The result is written as the book file read by
+yet_another_ai.OpeningBook: (Zobrist key, encoded move, weight) records sorted by key.
+The weight of a move is 2 points per win and 1 per draw of the side that played it, so moves that only ever lost are
+dropped.
+Usage: python build_book.py ../src/generate_data/sample.pgn --plies 20 --min-elo 2000 --output opening_book.bin
+"""
+
+RESULT_POINTS = {'1-0': (2, 0), '0-1': (0, 2), '1/2-1/2': (1, 1)} # points for (white, black)
+
+def elo(headers, name):
+    try:
+        return int(headers.get(name, 0))
+    except ValueError:
+        return 0
+
+def read_games(path):
+    """
+    Helper function: iterate over the games of a PGN file.
+    """
+    with open(path) as pgn:
+        while True:
+            game = chess.pgn.read_game(pgn)
+            if game is None:
+                break
+            yield game
+
+def collect(paths, plies, min_elo):
+    """
+    Inputs: PGN file names, number of plies to follow per game, minimum Elo of the side to move.
+    Outputs: dictionary (Zobrist key, encoded move) -> [times played, points], number of games used.
+    """
+    stats = collections.defaultdict(lambda: [0, 0])
+    games = 0
+    for path in paths:
+        for game in read_games(path):
+            points = RESULT_POINTS.get(game.headers.get('Result'))
+            if points is None: # unfinished game
+                continue
+            ratings = (elo(game.headers, 'BlackElo'), elo(game.headers, 'WhiteElo'))
+            board = ai.SearchBoard.from_board(game.board())
+            for move in itertools.islice(game.mainline_moves(), plies):
+                if ratings[board.turn] >= min_elo:
+                    entry = stats[(board.zobrist, ai.encode_move(move))]
+                    entry[0] += 1
+                    entry[1] += points[0] if board.turn == chess.WHITE else points[1]
+                board.push(move)
+            games += 1
+    return stats, games
+
+def build(stats, min_count):
+    """
+    Inputs: statistics from collect, minimum number of times a move must have been played.
+    Output: array of book records sorted by key (then move).
+    """
+    rows = [(key, move, min(points, 0xffffffff)) for (key, move), (count, points) in stats.items()
+            if count >= min_count and points > 0]
+    records = np.array(rows, dtype=ai.BOOK_RECORD)
+    return np.sort(records, order=['key', 'move'])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compile an opening book from PGN games.')
+    parser.add_argument('pgn', type=str, nargs='+', help='PGN files')
+    parser.add_argument('--output', type=str, default=ai.BOOK_FILE)
+    parser.add_argument('--plies', type=int, default=20, help='plies to follow from the start of every game')
+    parser.add_argument('--min-elo', type=int, default=0, help='skip moves by players rated below this')
+    parser.add_argument('--min-count', type=int, default=1, help='skip moves played fewer times than this')
+    args = parser.parse_args()
+
+    stats, games = collect(args.pgn, args.plies, args.min_elo)
+    records = build(stats, args.min_count)
+    records.tofile(args.output)
+    print("%d games, %d positions, %d moves written to %s"
+          % (games, len(np.unique(records['key'])), len(records), args.output))
@@ -0,0 +1,87 @@
+import argparse
+import multiprocessing
+import time
+import yet_another_ai as ai
+
+"""
+EPD test-suite runner. Every position of an EPD file is searched by ai_search (iterative deepening) under a time cap,
+and its best move is checked against the bm (best move) and am (avoid move) operations. The time-to-solution of a
+position is the time of the first iteration from which the move played stayed correct until the end of the search,
+so a move found early and then dropped does not count. Positions are searched in parallel, one per worker process,
+each from empty tables and without the opening book or the database.
+Usage: python epd_suite.py tactics.epd --time 5 --workers 4
+"""
+
+def _init_worker():
+    ai.STORE_MIN_DEPTH = ai.MAX_DEPTH + 1
+    ai.WARM_LOAD_ENTRIES = 0
+    ai.USE_BOOK = False
+
+def correct(move, operations):
+    if move is None:
+        return False
+    if 'bm' in operations and move not in operations['bm']:
+        return False
+    return move not in operations.get('am', [])
+
+def solve(task):
+    """
+    Search one EPD position. Output: dictionary with the id, the move played, whether it is correct, and the time and
+    depth from which it was correct for good (None if it was not).
+    """
+    line, time_limit = task
+    board, operations = ai.SearchBoard.from_epd(line)
+    ai.transposition_table.clear()
+    ai.move_ordering.clear()
+    iterations = []
+    move, statistics = ai.ai_search(board, board.turn, time_limit=time_limit,
+                                    info=lambda depth, score, pv, nodes, seconds: iterations.append((depth, seconds, pv[0])))
+    solved_at = None
+    for depth, seconds, best in iterations:
+        if not correct(best, operations):
+            solved_at = None
+        elif solved_at is None:
+            solved_at = (depth, seconds)
+    return {'id': operations.get('id', board.fen()),
+            'move': board.san(move) if move else None,
+            'expected': ' '.join(board.san(m) for m in operations.get('bm', [])) or
+                        'not ' + ' '.join(board.san(m) for m in operations.get('am', [])),
+            'solved': solved_at is not None and correct(move, operations),
+            'depth': solved_at[0] if solved_at else None,
+            'seconds': solved_at[1] if solved_at else None,
+            'searched_depth': iterations[-1][0] if iterations else 0,
+            'nodes': statistics.nodes + statistics.qnodes}
+
+def read_epd(path):
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+def run(lines, time_limit, workers):
+    tasks = [(line, time_limit) for line in lines]
+    if workers <= 1:
+        _init_worker()
+        return [solve(task) for task in tasks]
+    pool = multiprocessing.get_context('spawn').Pool(workers, initializer=_init_worker)
+    try:
+        return pool.map(solve, tasks, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run an EPD test suite and measure time-to-solution.')
+    parser.add_argument('epd', type=str, help='EPD file with bm and/or am operations')
+    parser.add_argument('--time', type=float, default=5.0, help='seconds per position')
+    parser.add_argument('--workers', type=int, default=ai.PARALLEL_WORKERS, help='positions searched at once')
+    args = parser.parse_args()
+
+    start = time.time()
+    results = run(read_epd(args.epd), args.time, args.workers)
+    for result in results:
+        print("%-20s %-8s expected %-12s %s" % (result['id'], result['move'], result['expected'],
+              "solved at depth %d in %.2f s" % (result['depth'], result['seconds']) if result['solved'] else
+              "not solved (depth %d)" % result['searched_depth']))
+    solved = [result for result in results if result['solved']]
+    print("solved %d of %d, mean time-to-solution %.2f s, mean depth %.1f, wall time %.1f s"
+          % (len(solved), len(results), sum(r['seconds'] for r in solved) / len(solved) if solved else 0.0,
+             sum(r['depth'] for r in solved) / float(len(solved)) if solved else 0.0, time.time() - start))
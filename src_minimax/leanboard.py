@@ -0,0 +1,530 @@
+"""
+Lean board for the quiescence search. A position is a handful of integer bitboards and a 64-square mailbox in a
+__slots__ object; moves are plain integers in the engine's encoding (from square, to square and promotion piece,
+6 + 6 + 3 bits, see yet_another_ai.encode_move); push and pop update the position in place and keep what pop needs in
+preallocated per-ply arrays instead of copying the board. Attacks come from precomputed tables: knight, king and
+pawn attacks by square, and sliding attacks looked up by the occupancy of the square's rank, file and diagonals.
+Only standard chess (no Chess960 castling). python-chess stays at the boundaries: positions are loaded from a
+python-chess Board and moves convert with yet_another_ai.encode_move/decode_move.
+Only the quiescence search runs on it. minimax and everything around it (transposition table, staged move ordering,
+null move, pondering, book) still run on yet_another_ai.SearchBoard, and every horizon node that does not stand pat
+at once loads its position here.
+"""
+
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(1, 7)
+BLACK, WHITE = 0, 1
+MAX_PLY = 256
+FULL = (1 << 64) - 1
+BB = [1 << square for square in range(64)]
+RANK_1, RANK_2, RANK_7, RANK_8 = 0xff, 0xff << 8, 0xff << 48, 0xff << 56
+STARTING_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+PIECE_SYMBOLS = " pnbrqk"
+
+# value of every piece (code = piece type | colour << 3) on every square, white positive; filled in by the engine
+PIECE_SQUARE = [[0] * 64 for code in range(16)]
+
+def _walk(square, occupied, deltas):
+    attacks = 0
+    for file_step, rank_step in deltas:
+        file, rank = square % 8 + file_step, square // 8 + rank_step
+        while 0 <= file < 8 and 0 <= rank < 8:
+            attacks |= BB[rank * 8 + file]
+            if occupied & BB[rank * 8 + file]:
+                break
+            file, rank = file + file_step, rank + rank_step
+    return attacks
+
+def _leaper(square, deltas):
+    attacks = 0
+    for file_step, rank_step in deltas:
+        file, rank = square % 8 + file_step, square // 8 + rank_step
+        if 0 <= file < 8 and 0 <= rank < 8:
+            attacks |= BB[rank * 8 + file]
+    return attacks
+
+def _squares(ray, delta):
+    """
+    Helper function: squares of a ray, nearest first.
+    """
+    squares = []
+    while ray:
+        square = (ray & -ray).bit_length() - 1
+        squares.append(square)
+        ray &= ray - 1
+    return squares if delta[0] + 8 * delta[1] > 0 else squares[::-1]
+
+def _line_tables(deltas):
+    """
+    Helper function: for every square, the mask of the squares whose occupancy matters along one line (the ends of
+    the line excluded) and a dictionary from every occupancy of that mask to the attacked squares.
+    """
+    masks, tables = [], []
+    for square in range(64):
+        mask = 0
+        for delta in deltas:
+            ray = _walk(square, 0, [delta])
+            if ray:
+                mask |= ray ^ BB[_squares(ray, delta)[-1]] # the last square of a ray blocks nothing behind it
+        table = {}
+        subset = 0
+        while True:
+            table[subset] = _walk(square, subset, deltas)
+            subset = (subset - mask) & mask
+            if subset == 0:
+                break
+        masks.append(mask)
+        tables.append(table)
+    return masks, tables
+
+RANK_MASKS, RANK_ATTACKS = _line_tables([(1, 0), (-1, 0)])
+FILE_MASKS, FILE_ATTACKS = _line_tables([(0, 1), (0, -1)])
+DIAG_MASKS, DIAG_ATTACKS = _line_tables([(1, 1), (-1, -1)])
+ANTI_MASKS, ANTI_ATTACKS = _line_tables([(1, -1), (-1, 1)])
+KNIGHT_ATTACKS = [_leaper(square, [(1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1), (-2, 1), (-1, 2)])
+                  for square in range(64)]
+KING_ATTACKS = [_leaper(square, [(1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1), (0, -1), (1, -1)])
+                for square in range(64)]
+PAWN_ATTACKS = [[_leaper(square, [(-1, -1), (1, -1)]) for square in range(64)],
+                [_leaper(square, [(-1, 1), (1, 1)]) for square in range(64)]]
+ROOK_RAYS = [RANK_ATTACKS[square][0] | FILE_ATTACKS[square][0] for square in range(64)]
+BISHOP_RAYS = [DIAG_ATTACKS[square][0] | ANTI_ATTACKS[square][0] for square in range(64)]
+
+def _lines():
+    between = [[0] * 64 for square in range(64)]
+    line = [[0] * 64 for square in range(64)]
+    for a in range(64):
+        for deltas in ([(1, 0), (-1, 0)], [(0, 1), (0, -1)], [(1, 1), (-1, -1)], [(1, -1), (-1, 1)]):
+            full = _walk(a, 0, deltas) | BB[a]
+            for delta in deltas:
+                passed = 0
+                for b in _squares(_walk(a, 0, [delta]), delta):
+                    between[a][b] = passed
+                    line[a][b] = full
+                    passed |= BB[b]
+    return between, line
+
+BETWEEN, LINE = _lines()
+
+def rook_attacks(square, occupied):
+    return RANK_ATTACKS[square][occupied & RANK_MASKS[square]] | FILE_ATTACKS[square][occupied & FILE_MASKS[square]]
+
+def bishop_attacks(square, occupied):
+    return DIAG_ATTACKS[square][occupied & DIAG_MASKS[square]] | ANTI_ATTACKS[square][occupied & ANTI_MASKS[square]]
+
+def move_uci(move):
+    """
+    Helper function: UCI notation of an integer move.
+    """
+    uci = "abcdefgh"[move & 7] + str((move >> 3 & 7) + 1) + "abcdefgh"[move >> 6 & 7] + str((move >> 9 & 7) + 1)
+    return uci + PIECE_SYMBOLS[move >> 12] if move >> 12 else uci
+
+class Position(object):
+    """
+    A chess position with in-place push/pop of integer moves.
+        bb: bitboard of every piece code (piece type | colour << 3)
+        occ: bitboard of each colour's pieces
+        board: piece code on every square, 0 if empty
+        turn: WHITE (1) or BLACK (0)
+        castling: bitboard of the rooks that may still castle, as python-chess's castling_rights
+        ep: en passant square after a double pawn push, -1 if none
+        score: sum of PIECE_SQUARE over the pieces, kept up to date by push and pop
+    """
+    __slots__ = ('bb', 'occ', 'board', 'turn', 'castling', 'ep', 'halfmove', 'score', 'ply',
+                 'undo_move', 'undo_captured', 'undo_castling', 'undo_ep', 'undo_halfmove', 'undo_score')
+
+    def __init__(self, fen=STARTING_FEN):
+        self.bb = [0] * 16
+        self.occ = [0, 0]
+        self.board = [0] * 64
+        self.undo_move = [0] * MAX_PLY
+        self.undo_captured = [0] * MAX_PLY
+        self.undo_castling = [0] * MAX_PLY
+        self.undo_ep = [0] * MAX_PLY
+        self.undo_halfmove = [0] * MAX_PLY
+        self.undo_score = [0] * MAX_PLY
+        self.ply = 0
+        if fen is not None:
+            self.set_fen(fen)
+
+    def _clear(self):
+        board = self.board
+        occupied = self.occ[0] | self.occ[1]
+        while occupied:
+            board[(occupied & -occupied).bit_length() - 1] = 0
+            occupied &= occupied - 1
+        for code in range(16):
+            self.bb[code] = 0
+        self.occ[0] = self.occ[1] = 0
+        self.ply = 0
+
+    def _put(self, code, square):
+        self.bb[code] |= BB[square]
+        self.occ[code >> 3] |= BB[square]
+        self.board[square] = code
+        self.score += PIECE_SQUARE[code][square]
+
+    def set_fen(self, fen):
+        parts = fen.split()
+        self._clear()
+        self.score = 0
+        square = 56
+        for char in parts[0]:
+            if char == '/':
+                square -= 16
+            elif char.isdigit():
+                square += int(char)
+            else:
+                self._put(PIECE_SYMBOLS.index(char.lower()) | (WHITE << 3 if char.isupper() else 0), square)
+                square += 1
+        self.turn = WHITE if parts[1] == 'w' else BLACK
+        self.castling = 0
+        for char, rook in (('K', 7), ('Q', 0), ('k', 63), ('q', 56)):
+            if char in parts[2]:
+                self.castling |= BB[rook]
+        self.ep = -1 if parts[3] == '-' else "abcdefgh".index(parts[3][0]) + 8 * (int(parts[3][1]) - 1)
+        self.halfmove = int(parts[4]) if len(parts) > 4 else 0
+
+    def load(self, board, score=None):
+        """
+        Set up the position of a python-chess Board, reusing this object's arrays. score, if known (the engine's
+        incremental evaluation), saves summing PIECE_SQUARE.
+        """
+        squares = self.board
+        occupied = self.occ[0] | self.occ[1]
+        while occupied:
+            square = occupied.bit_length() - 1
+            occupied ^= BB[square]
+            squares[square] = 0
+        bb = self.bb
+        white, black = board.occupied_co[1], board.occupied_co[0]
+        total = 0
+        for piece_type, pieces in ((PAWN, board.pawns), (KNIGHT, board.knights), (BISHOP, board.bishops),
+                                   (ROOK, board.rooks), (QUEEN, board.queens), (KING, board.kings)):
+            for code, mask in ((piece_type | WHITE << 3, pieces & white), (piece_type, pieces & black)):
+                bb[code] = mask
+                values = PIECE_SQUARE[code]
+                while mask:
+                    square = mask.bit_length() - 1
+                    mask ^= BB[square]
+                    squares[square] = code
+                    total += values[square]
+        self.occ[1] = white
+        self.occ[0] = black
+        self.score = total if score is None else score
+        self.turn = WHITE if board.turn else BLACK
+        self.castling = board.castling_rights
+        self.ep = -1 if board.ep_square is None else board.ep_square
+        self.halfmove = board.halfmove_clock
+        self.ply = 0
+        return self
+
+    # the parts of python-chess's Board interface that the bitbases use
+    @property
+    def occupied(self):
+        return self.occ[0] | self.occ[1]
+
+    @property
+    def castling_rights(self):
+        return self.castling
+
+    def pieces_mask(self, piece_type, color):
+        return self.bb[piece_type | (WHITE << 3 if color else 0)]
+
+    def attackers(self, square, color, occupied):
+        """
+        Output: bitboard of the pieces of color attacking square, given the occupancy occupied.
+        """
+        bb = self.bb
+        c = color << 3
+        return ((KNIGHT_ATTACKS[square] & bb[c | KNIGHT]) | (KING_ATTACKS[square] & bb[c | KING]) |
+                (PAWN_ATTACKS[color ^ 1][square] & bb[c | PAWN]) |
+                (rook_attacks(square, occupied) & (bb[c | ROOK] | bb[c | QUEEN])) |
+                (bishop_attacks(square, occupied) & (bb[c | BISHOP] | bb[c | QUEEN]))) & occupied
+
+    def is_attacked(self, square, color, occupied):
+        bb = self.bb
+        c = color << 3
+        return bool((KNIGHT_ATTACKS[square] & bb[c | KNIGHT]) or (KING_ATTACKS[square] & bb[c | KING]) or
+                    (PAWN_ATTACKS[color ^ 1][square] & bb[c | PAWN]) or
+                    (rook_attacks(square, occupied) & (bb[c | ROOK] | bb[c | QUEEN])) or
+                    (bishop_attacks(square, occupied) & (bb[c | BISHOP] | bb[c | QUEEN])))
+
+    def king(self, color):
+        return self.bb[KING | color << 3].bit_length() - 1
+
+    def is_check(self):
+        return self.is_attacked(self.king(self.turn), self.turn ^ 1, self.occ[0] | self.occ[1])
+
+    def generate(self, tactical=False):
+        """
+        Output: list of the pseudo-legal moves, or with tactical only the captures and promotions. Moves come in
+        python-chess's order (pieces then pawns, highest square first), so that searches that sort them stably
+        break ties the same way on both boards.
+        """
+        moves = []
+        append = moves.append
+        us = self.turn
+        board = self.board
+        c = us << 3
+        ours = self.occ[us]
+        theirs = self.occ[us ^ 1]
+        occupied = ours | theirs
+        targets = theirs if tactical else FULL ^ ours
+        pawns = self.bb[c | PAWN]
+        pieces = ours ^ pawns
+        while pieces:
+            origin = pieces.bit_length() - 1
+            pieces ^= BB[origin]
+            piece_type = board[origin] & 7
+            if piece_type == KNIGHT:
+                to_mask = KNIGHT_ATTACKS[origin] & targets
+            elif piece_type == BISHOP:
+                to_mask = bishop_attacks(origin, occupied) & targets
+            elif piece_type == ROOK:
+                to_mask = rook_attacks(origin, occupied) & targets
+            elif piece_type == QUEEN:
+                to_mask = (rook_attacks(origin, occupied) | bishop_attacks(origin, occupied)) & targets
+            else:
+                to_mask = KING_ATTACKS[origin] & targets
+            while to_mask:
+                target = to_mask.bit_length() - 1
+                to_mask ^= BB[target]
+                append(origin | target << 6)
+        if not tactical and self.castling & ours:
+            self._castling_moves(append, us, occupied)
+
+        last_rank = RANK_8 if us == WHITE else RANK_1
+        capturers = pawns
+        while capturers:
+            origin = capturers.bit_length() - 1
+            capturers ^= BB[origin]
+            to_mask = PAWN_ATTACKS[us][origin] & theirs
+            while to_mask:
+                target = to_mask.bit_length() - 1
+                to_mask ^= BB[target]
+                self._pawn_move(append, origin, target, last_rank)
+        if tactical:
+            self._en_passant_moves(append, pawns)
+        if us == WHITE:
+            single = (pawns << 8) & ~occupied & FULL
+            double = ((single & (RANK_2 << 8)) << 8) & ~occupied
+            step = 8
+        else:
+            single = (pawns >> 8) & ~occupied
+            double = ((single & (RANK_7 >> 8)) >> 8) & ~occupied
+            step = -8
+        if tactical:
+            single &= last_rank
+            double = 0
+        while single:
+            target = single.bit_length() - 1
+            single ^= BB[target]
+            self._pawn_move(append, target - step, target, last_rank)
+        while double:
+            target = double.bit_length() - 1
+            double ^= BB[target]
+            append((target - 2 * step) | target << 6)
+        if not tactical:
+            self._en_passant_moves(append, pawns)
+        return moves
+
+    def _en_passant_moves(self, append, pawns):
+        if self.ep >= 0:
+            capturers = PAWN_ATTACKS[self.turn ^ 1][self.ep] & pawns
+            while capturers:
+                origin = capturers.bit_length() - 1
+                capturers ^= BB[origin]
+                append(origin | self.ep << 6)
+
+    @staticmethod
+    def _pawn_move(append, origin, target, last_rank):
+        if BB[target] & last_rank:
+            for promotion in (QUEEN, ROOK, BISHOP, KNIGHT):
+                append(origin | target << 6 | promotion << 12)
+        else:
+            append(origin | target << 6)
+
+    def _castling_moves(self, append, us, occupied):
+        king = 4 if us == WHITE else 60
+        if self.board[king] != (KING | us << 3) or self.is_attacked(king, us ^ 1, occupied):
+            return
+        if self.castling & BB[king + 3] and not occupied & (BB[king + 1] | BB[king + 2]):
+            if not self.is_attacked(king + 1, us ^ 1, occupied) and not self.is_attacked(king + 2, us ^ 1, occupied):
+                append(king | (king + 2) << 6)
+        if self.castling & BB[king - 4] and not occupied & (BB[king - 1] | BB[king - 2] | BB[king - 3]):
+            if not self.is_attacked(king - 1, us ^ 1, occupied) and not self.is_attacked(king - 2, us ^ 1, occupied):
+                append(king | (king - 2) << 6)
+
+    def pinned(self, color, king):
+        """
+        Output: bitboard of the pieces of color pinned to their king.
+        """
+        bb = self.bb
+        c = (color ^ 1) << 3
+        occupied = self.occ[0] | self.occ[1]
+        snipers = ((ROOK_RAYS[king] & (bb[c | ROOK] | bb[c | QUEEN])) |
+                   (BISHOP_RAYS[king] & (bb[c | BISHOP] | bb[c | QUEEN])))
+        pinned = 0
+        while snipers:
+            sniper = (snipers & -snipers).bit_length() - 1
+            snipers &= snipers - 1
+            blockers = BETWEEN[king][sniper] & occupied
+            if blockers and not blockers & (blockers - 1) and blockers & self.occ[color]:
+                pinned |= blockers
+        return pinned
+
+    def legal(self, moves):
+        """
+        Output: the legal moves among the pseudo-legal moves. Out of check, only king moves, en passant captures and
+        moves of pinned pieces need testing; in check, every move is played and tested.
+        """
+        us = self.turn
+        them = us ^ 1
+        king = self.king(us)
+        occupied = self.occ[0] | self.occ[1]
+        legal = []
+        if self.is_attacked(king, them, occupied):
+            others = []
+            for move in moves:
+                self.push(move)
+                if not self.is_attacked(self.king(us), them, self.occ[0] | self.occ[1]):
+                    (legal if move & 63 == king else others).append(move)
+                self.pop()
+            return legal + others # king moves first, as python-chess generates evasions
+        pinned = self.pinned(us, king)
+        for move in moves:
+            origin = move & 63
+            target = move >> 6 & 63
+            if origin == king:
+                if self.is_attacked(target, them, occupied ^ BB[king]):
+                    continue
+            elif target == self.ep and self.board[origin] & 7 == PAWN:
+                self.push(move)
+                attacked = self.is_attacked(king, them, self.occ[0] | self.occ[1])
+                self.pop()
+                if attacked:
+                    continue
+            elif BB[origin] & pinned and not LINE[king][origin] & BB[target]:
+                continue
+            legal.append(move)
+        return legal
+
+    @property
+    def legal_moves(self):
+        return self.legal(self.generate())
+
+    def push(self, move):
+        """
+        Make a (pseudo-)legal move.
+        """
+        origin = move & 63
+        target = move >> 6 & 63
+        promotion = move >> 12
+        board = self.board
+        bb = self.bb
+        occ = self.occ
+        us = self.turn
+        them = us ^ 1
+        code = board[origin]
+        captured = board[target]
+        ply = self.ply
+        self.undo_move[ply] = move
+        self.undo_castling[ply] = self.castling
+        self.undo_ep[ply] = self.ep
+        self.undo_halfmove[ply] = self.halfmove
+        self.undo_score[ply] = self.score
+        self.ply = ply + 1
+        score = self.score
+        from_to = BB[origin] | BB[target]
+        halfmove = self.halfmove + 1
+        if captured:
+            bb[captured] ^= BB[target]
+            occ[them] ^= BB[target]
+            score -= PIECE_SQUARE[captured][target]
+            halfmove = 0
+        bb[code] ^= from_to
+        occ[us] ^= from_to
+        board[origin] = 0
+        board[target] = code
+        score += PIECE_SQUARE[code][target] - PIECE_SQUARE[code][origin]
+        ep = -1
+        piece_type = code & 7
+        if piece_type == PAWN:
+            halfmove = 0
+            if target == self.ep:
+                square = target - 8 if us == WHITE else target + 8
+                captured = board[square]
+                bb[captured] ^= BB[square]
+                occ[them] ^= BB[square]
+                board[square] = 0
+                score -= PIECE_SQUARE[captured][square]
+            elif target - origin in (16, -16):
+                ep = (origin + target) >> 1
+            elif promotion:
+                promoted = promotion | us << 3
+                bb[code] ^= BB[target]
+                bb[promoted] ^= BB[target]
+                board[target] = promoted
+                score += PIECE_SQUARE[promoted][target] - PIECE_SQUARE[code][target]
+        elif piece_type == KING:
+            self.castling &= RANK_8 if us == WHITE else RANK_1
+            if target - origin == 2 or origin - target == 2:
+                rook_from, rook_to = (origin + 3, origin + 1) if target > origin else (origin - 4, origin - 1)
+                rook = ROOK | us << 3
+                bb[rook] ^= BB[rook_from] | BB[rook_to]
+                occ[us] ^= BB[rook_from] | BB[rook_to]
+                board[rook_from] = 0
+                board[rook_to] = rook
+                score += PIECE_SQUARE[rook][rook_to] - PIECE_SQUARE[rook][rook_from]
+        self.castling &= ~from_to
+        self.undo_captured[ply] = captured
+        self.ep = ep
+        self.halfmove = halfmove
+        self.score = score
+        self.turn = them
+
+    def pop(self):
+        """
+        Take back the last move.
+        """
+        ply = self.ply - 1
+        self.ply = ply
+        move = self.undo_move[ply]
+        origin = move & 63
+        target = move >> 6 & 63
+        board = self.board
+        bb = self.bb
+        occ = self.occ
+        them = self.turn
+        us = them ^ 1
+        code = board[target]
+        if move >> 12:
+            bb[code] ^= BB[target]
+            code = PAWN | us << 3
+            bb[code] ^= BB[origin]
+        else:
+            bb[code] ^= BB[origin] | BB[target]
+        occ[us] ^= BB[origin] | BB[target]
+        board[origin] = code
+        board[target] = 0
+        captured = self.undo_captured[ply]
+        ep = self.undo_ep[ply]
+        if captured:
+            square = target
+            if target == ep and code & 7 == PAWN:
+                square = target - 8 if us == WHITE else target + 8
+            bb[captured] ^= BB[square]
+            occ[them] ^= BB[square]
+            board[square] = captured
+        if code & 7 == KING and (target - origin == 2 or origin - target == 2):
+            rook_from, rook_to = (origin + 3, origin + 1) if target > origin else (origin - 4, origin - 1)
+            rook = ROOK | us << 3
+            bb[rook] ^= BB[rook_from] | BB[rook_to]
+            occ[us] ^= BB[rook_from] | BB[rook_to]
+            board[rook_to] = 0
+            board[rook_from] = rook
+        self.castling = self.undo_castling[ply]
+        self.ep = ep
+        self.halfmove = self.undo_halfmove[ply]
+        self.score = self.undo_score[ply]
+        self.turn = us
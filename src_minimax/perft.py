@@ -0,0 +1,107 @@
+import argparse
+import time
+import chess
+import yet_another_ai as ai
+import leanboard
+
+"""
+Perft: count the leaf nodes of the legal move tree to a fixed depth. The counts of the standard test positions are
+known, so a mismatch means a move generation or make/unmake bug, and the time taken measures the raw speed of the
+board backend that bounds the search. Leaves are counted in bulk (the legal moves at depth 1 are counted, not played)
+unless --no-bulk is given, which also times making and unmaking the last ply.
+Backends: 'search' is the engine's SearchBoard (python-chess plus incremental Zobrist key and evaluation), 'chess' is
+a plain python-chess Board, 'lean' is the leanboard Position used by the quiescence search.
+Usage: python perft.py --depth 3                       (test suite with known counts)
+       python perft.py --depth 4 --fen "<fen>" --divide  (one position, with the count of every root move)
+"""
+
+BACKENDS = {
+    'search': ai.SearchBoard,
+    'chess': chess.Board,
+    'lean': leanboard.Position,
+}
+
+# standard test positions and their node counts at depth 1, 2, 3, ... (chessprogramming.org, Perft Results)
+POSITIONS = [
+    ("rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1", [20, 400, 8902, 197281, 4865609]),
+    ("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1", [48, 2039, 97862, 4085603]),
+    ("8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", [14, 191, 2812, 43238, 674624]),
+    ("r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1", [6, 264, 9467, 422333]),
+    ("rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8", [44, 1486, 62379, 2103487]),
+    ("r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10", [46, 2079, 89890, 3894594]),
+]
+
+def perft(board, depth, bulk=True):
+    """
+    Output: number of leaf nodes of the legal move tree of board to the given depth.
+    """
+    if depth == 0:
+        return 1
+    moves = list(board.legal_moves)
+    if depth == 1 and bulk:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        board.push(move)
+        nodes += perft(board, depth - 1, bulk)
+        board.pop()
+    return nodes
+
+def divide(board, depth, bulk=True):
+    """
+    Output: list of (move, leaf nodes below it), the per-move breakdown used to locate a wrong count.
+    """
+    result = []
+    for move in list(board.legal_moves):
+        board.push(move)
+        result.append((move, perft(board, depth - 1, bulk)))
+        board.pop()
+    return result
+
+def run_suite(backend, depth, bulk=True):
+    """
+    Run every test position to depth (or its deepest known count). Output: whether all counts matched.
+    """
+    total_nodes = 0
+    total_time = 0.0
+    passed = True
+    for fen, counts in POSITIONS:
+        board = BACKENDS[backend](fen)
+        d = min(depth, len(counts))
+        start = time.time()
+        nodes = perft(board, d, bulk)
+        seconds = time.time() - start
+        ok = nodes == counts[d - 1]
+        passed = passed and ok
+        total_nodes += nodes
+        total_time += seconds
+        print("%-72s depth %d %10d %s %8.2f s %10d nps"
+              % (fen, d, nodes, 'ok' if ok else 'FAIL (expected %d)' % counts[d - 1], seconds, nodes / max(seconds, 1e-9)))
+    print("%s: %d nodes in %.2f s, %d nps, %s"
+          % (backend, total_nodes, total_time, total_nodes / max(total_time, 1e-9), 'all ok' if passed else 'FAILED'))
+    return passed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Perft move generation test and benchmark.')
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--fen', type=str, default=None, help='single position instead of the test suite')
+    parser.add_argument('--divide', action='store_true', help='print the count of every root move')
+    parser.add_argument('--no-bulk', dest='bulk', action='store_false', help='play the moves of the last ply too')
+    parser.add_argument('--backend', type=str, choices=sorted(BACKENDS), default='search')
+    args = parser.parse_args()
+
+    if args.fen is None:
+        if not run_suite(args.backend, args.depth, args.bulk):
+            raise SystemExit(1)
+    else:
+        board = BACKENDS[args.backend](args.fen)
+        start = time.time()
+        if args.divide:
+            nodes = 0
+            for move, count in divide(board, args.depth, args.bulk):
+                print("%s: %d" % (leanboard.move_uci(move) if args.backend == 'lean' else move.uci(), count))
+                nodes += count
+        else:
+            nodes = perft(board, args.depth, args.bulk)
+        seconds = time.time() - start
+        print("nodes %d time %.2f s nps %d" % (nodes, seconds, nodes / max(seconds, 1e-9)))
@@ -0,0 +1,32 @@
+import argparse
+import time
+import yet_another_ai as ai
+
+"""
+Mate solver. Looks for a forced mate by the side to move in each position with mateSearch (proof-number search) and
+prints the mating line, or that no mate was found within the node limit. The line is a forced mate, not necessarily
+the shortest one.
+Usage: python solve_mate.py "6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1" --nodes 1000000
+"""
+
+def solve(fen, nodes, table_size):
+    board = ai.SearchBoard(fen)
+    start = time.time()
+    line = ai.mateSearch(board, nodes, table_size)
+    seconds = time.time() - start
+    if line is None:
+        print("%s: no mate found, %d nodes, %.2f s" % (fen, ai.search_control.nodes, seconds))
+    else:
+        print("%s: mates in %d, %d nodes, %.2f s: %s"
+              % (fen, (len(line) + 1) // 2, ai.search_control.nodes, seconds, board.variation_san(line)))
+    return line
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Find forced mates by proof-number search.')
+    parser.add_argument('fen', type=str, nargs='+', help='positions, the side to move mating')
+    parser.add_argument('--nodes', type=int, default=ai.MATE_NODE_LIMIT, help='positions to expand per search')
+    parser.add_argument('--table-size', type=int, default=ai.MATE_TABLE_SIZE, help='positions kept in the table')
+    args = parser.parse_args()
+
+    for fen in args.fen:
+        solve(fen, args.nodes, args.table_size)
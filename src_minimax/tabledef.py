@@ -1,35 +1,174 @@
-from sqlalchemy import *
-from sqlalchemy import create_engine, ForeignKey, Index
-from sqlalchemy import Column, Date, Integer, String, Float
+from sqlalchemy import create_engine, event, text
+from sqlalchemy import Column, Integer
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship, backref
- 
-engine = create_engine('sqlite:///chess_db.db', echo=True)
+from sqlalchemy.pool import StaticPool
+import argparse
+import json
+import atexit
+import time
+
+DATABASE = 'sqlite:///chess_db.db'
 Base = declarative_base()
- 
+
 ########################################################################
-class Moves(Base):
+class Positions(Base):
+    """
+    Primary database to store search results, one row per position.
+    key is the 64-bit Zobrist key of the position, stored as a signed 8-byte integer. Declared INTEGER so that it is
+    SQLite's rowid, with no separate index. depth, flag, value and move are the transposition table entry (move encoded
+    as an integer, 0 for none). hits counts how often the position was stored and decides what is loaded at engine
+    start; last_used (the last time it was stored or loaded) decides what is evicted when the table is full.
+    """
+    __tablename__ = "positions"
+
+    key = Column(Integer, primary_key=True, autoincrement=False)
+    depth = Column(Integer)
+    flag = Column(Integer)
+    value = Column(Integer)
+    move = Column(Integer)
+    hits = Column(Integer)
+    last_used = Column(Integer, index=True)
+
+UPSERT = text("""
+    INSERT INTO positions (key, depth, flag, value, move, hits, last_used)
+    VALUES (:key, :depth, :flag, :value, :move, :hits, :last_used)
+    ON CONFLICT(key) DO UPDATE SET
+        flag = CASE WHEN excluded.depth >= positions.depth THEN excluded.flag ELSE positions.flag END,
+        value = CASE WHEN excluded.depth >= positions.depth THEN excluded.value ELSE positions.value END,
+        move = CASE WHEN excluded.depth >= positions.depth THEN excluded.move ELSE positions.move END,
+        depth = MAX(positions.depth, excluded.depth),
+        hits = positions.hits + excluded.hits,
+        last_used = excluded.last_used
+""")
+
+def to_signed(key):
+    """
+    Helper function: map an unsigned 64-bit key to the signed 8-byte integer SQLite stores, and back.
+    """
+    return key - (1 << 64) if key >= (1 << 63) else key
+
+def to_unsigned(key):
+    return key + (1 << 64) if key < 0 else key
+
+class EvaluationStore(object):
     """
-    Primary database to store move evaluation
-    I did not intialize state as an indexed column in the beginning. Thus the last 5 lines.
+    Persistent store of search results on a single long-lived SQLite connection in WAL mode.
+    Writes are buffered in memory and flushed every batch_size new entries, and when the engine exits. The table is
+    capped at max_entries rows; the least recently used rows (stored or warm-loaded longest ago) are evicted when a
+    flush goes over the cap. The number of rows is counted once and then kept up to date by the flushes.
     """
-    __tablename__ = "moves"
- 
-    id = Column(Integer, primary_key=True)
-    state = Column(String, index=True)
-    value = Column(Float)
- 
-    #----------------------------------------------------------------------
-    def __init__(self, state, value):
-        """"""
-        self.state = state
-        self.value = value
- 
-# create tables
-Base.metadata.create_all(engine)
-
-try:
-    state_index = Index('state_idx', Moves.state) # index column. Effectively compromising space for searching speed.
-    state_index.create(bind=engine)
-except:
-    pass
\ No newline at end of file
+    def __init__(self, url=DATABASE, batch_size=1000, max_entries=2000000):
+        self.engine = create_engine(url, poolclass=StaticPool, connect_args={'check_same_thread': False})
+        event.listen(self.engine, 'connect', self._configure)
+        Base.metadata.create_all(self.engine)
+        self.connection = self.engine.connect()
+        self.batch_size = batch_size
+        self.max_entries = max_entries
+        self.pending = {}
+        self.rows = None
+        self.warm_loaded = False
+        atexit.register(self.close)
+
+    @staticmethod
+    def _configure(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
+    def put(self, key, depth, flag, value, move):
+        """
+        Buffer a search result. Only the deepest result per position is kept; repeated puts count as hits.
+        Inputs: Zobrist key (unsigned), depth, bound flag, score and encoded move, as in the transposition table.
+        """
+        entry = self.pending.get(key)
+        if entry is None:
+            self.pending[key] = [depth, flag, value, move, 1]
+            if len(self.pending) >= self.batch_size:
+                self.flush()
+        else:
+            if depth >= entry[0]:
+                entry[:4] = [depth, flag, value, move]
+            entry[4] += 1
+
+    def flush(self):
+        """
+        Write the buffered entries in one transaction, then evict down to max_entries.
+        """
+        if not self.pending or self.connection is None:
+            return
+        now = int(time.time())
+        rows = [{'key': to_signed(key), 'depth': depth, 'flag': flag, 'value': value, 'move': move,
+                 'hits': hits, 'last_used': now}
+                for key, (depth, flag, value, move, hits) in self.pending.items()]
+        keys = json.dumps([row['key'] for row in rows])
+        self.pending = {}
+        with self.connection.begin():
+            if self.rows is None:
+                self.rows = self.connection.execute(text("SELECT COUNT(*) FROM positions")).scalar()
+            existing = self.connection.execute(text("SELECT COUNT(*) FROM positions WHERE key IN "
+                                                    "(SELECT value FROM json_each(:keys))"), {'keys': keys}).scalar()
+            self.connection.execute(UPSERT, rows)
+            self.rows += len(rows) - existing
+            self._evict(self.max_entries)
+
+    def _evict(self, max_entries):
+        if self.rows is None:
+            self.rows = self.connection.execute(text("SELECT COUNT(*) FROM positions")).scalar()
+        if self.rows > max_entries:
+            self.connection.execute(text("DELETE FROM positions WHERE key IN "
+                                         "(SELECT key FROM positions ORDER BY last_used LIMIT :excess)"),
+                                    {'excess': self.rows - max_entries})
+            self.rows = max_entries
+
+    def warm_load(self, limit):
+        """
+        Output: the limit most stored entries, as (key, depth, flag, value, move) tuples with unsigned keys. Loading
+        counts as a use, so the loaded rows are the last to be evicted.
+        """
+        self.flush()
+        with self.connection.begin():
+            rows = self.connection.execute(text("SELECT key, depth, flag, value, move FROM positions "
+                                                "ORDER BY hits DESC LIMIT :limit"), {'limit': limit}).fetchall()
+            self.connection.execute(text("UPDATE positions SET last_used = :now WHERE key IN "
+                                         "(SELECT value FROM json_each(:keys))"),
+                                    {'now': int(time.time()), 'keys': json.dumps([row[0] for row in rows])})
+        self.warm_loaded = True
+        return [(to_unsigned(row[0]), row[1], row[2], row[3], row[4]) for row in rows]
+
+    def count(self):
+        with self.connection.begin():
+            self.rows = self.connection.execute(text("SELECT COUNT(*) FROM positions")).scalar()
+            return self.rows
+
+    def compact(self, max_entries=None):
+        """
+        Flush, evict down to max_entries (default: the store's cap) and rebuild the database file to reclaim space.
+        """
+        self.flush()
+        with self.connection.begin():
+            self._evict(self.max_entries if max_entries is None else max_entries)
+        self.connection.exec_driver_sql("VACUUM")
+        if self.connection.in_transaction():
+            self.connection.commit()
+
+    def close(self):
+        if self.connection is None:
+            return
+        self.flush()
+        self.connection.close()
+        self.connection = None
+        self.engine.dispose()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Maintenance of the search result database.')
+    parser.add_argument('command', choices=['compact', 'count'])
+    parser.add_argument('--database', type=str, default=DATABASE, help='SQLAlchemy database URL')
+    parser.add_argument('--max-entries', type=int, default=None, help='cap to evict down to when compacting')
+    args = parser.parse_args()
+
+    store = EvaluationStore(args.database)
+    if args.command == 'compact':
+        store.compact(args.max_entries)
+    print("%d positions" % store.count())
+    store.close()
@@ -0,0 +1,41 @@
+import unittest
+import yet_another_ai as ai
+
+class searchTestCase(unittest.TestCase):
+
+    PRUNING = ('USE_NULL_MOVE', 'USE_LMR', 'USE_FUTILITY', 'USE_RAZORING', 'USE_SEE_PRUNING')
+
+    def setUp(self):
+        self.saved = dict((name, getattr(ai, name)) for name in self.PRUNING + ('STORE_MIN_DEPTH', 'tt_lookup',
+                                                                                'tt_save', 'transposition_table'))
+        for name in self.PRUNING:
+            setattr(ai, name, False)
+        ai.STORE_MIN_DEPTH = ai.MAX_DEPTH + 1 # keep the tests out of the database
+
+    def tearDown(self):
+        for name, value in self.saved.items():
+            setattr(ai, name, value)
+
+    def search(self, fen, depth, use_table):
+        ai.set_transposition_table(ai.TranspositionTable(ai.TT_SIZE))
+        if not use_table:
+            ai.tt_lookup = lambda board, depth, alpha, beta, is_maximizer: (None, None)
+            ai.tt_save = lambda *args: None
+        board = ai.SearchBoard(fen)
+        ai.transposition_table.new_search()
+        ai.move_ordering.new_search(board)
+        value, line = ai.search_root(depth, board, True, board.turn)
+        return value, line[0].uci()
+
+    def test_transposition_table_keeps_result(self):
+        # delta pruning in the quiescence search once returned the stand pat score as a fail-low bound, which the
+        # table stored and the null-window searches trusted: 25/g4h5 instead of -15/h3g5
+        fen = 'rn1qkb1r/pbpppp2/1p3n2/6pp/5PP1/1P5N/P1PPP2P/RNBQKBR1 w Qkq - 0 6'
+        with_table = self.search(fen, 3, True)
+        without_table = self.search(fen, 3, False)
+
+        self.assertEqual(with_table, without_table)
+        self.assertEqual(with_table, (-15, 'h3g5'))
+
+if __name__ == '__main__':
+    unittest.main()
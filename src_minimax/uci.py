@@ -0,0 +1,183 @@
+import sys
+import threading
+import time
+import chess
+import yet_another_ai as ai
+
+"""
+UCI (Universal Chess Interface) front-end, so the engine can be run by GUIs and match managers.
+Supported commands: uci, isready, ucinewgame, setoption name Hash value <MB>, position [startpos | fen <fen>]
+[moves ...], go [depth N] [movetime ms] [nodes N] [wtime ms] [btime ms] [winc ms] [binc ms] [infinite] [ponder],
+ponderhit, stop, quit.
+The search runs in a background thread and reports every completed iteration as an info line with depth, nodes, nps,
+score and pv; stop ends it at once with the best move of the last completed iteration. A go infinite or go ponder
+search never answers on its own: bestmove waits for stop, or for ponderhit, from which on a ponder search runs as a
+normal search with the time limit of the go command counted from the ponderhit.
+Usage: python uci.py
+"""
+
+ENGINE_NAME = 'yet_another_ai'
+ENGINE_AUTHOR = 'Chess-AI'
+TT_ENTRY_BYTES = 160 # approximate memory of one transposition table entry, to size the table from the Hash option
+DEFAULT_HASH = ai.TT_SIZE * TT_ENTRY_BYTES >> 20
+
+def send(line):
+    sys.stdout.write(line + '\n')
+    sys.stdout.flush()
+
+def score_string(score):
+    """
+    Helper function: UCI form of a search score, in centipawns or in moves to mate.
+    """
+    if abs(score) > ai.MATE_BOUND:
+        moves = (ai.MATE_SCORE - abs(score) + 1) // 2
+        return 'mate %d' % (moves if score > 0 else -moves)
+    return 'cp %d' % score
+
+class UCIEngine(object):
+    """
+    State of the engine between commands: the current position and the search thread, if one is running.
+    """
+    def __init__(self):
+        self.board = ai.SearchBoard()
+        self.thread = None
+        self.stopped = False
+        self.release = threading.Event() # set once bestmove may be sent
+        self.ponder_limit = None
+        self.deadline = None
+
+    def position(self, tokens):
+        if tokens[0] == 'startpos':
+            board = ai.SearchBoard()
+            rest = tokens[1:]
+        else:
+            board = ai.SearchBoard(' '.join(tokens[1:7]))
+            rest = tokens[7:]
+        if rest and rest[0] == 'moves':
+            for uci in rest[1:]:
+                board.push(chess.Move.from_uci(uci))
+        self.board = board
+
+    def go(self, tokens):
+        """
+        Start searching the current position with the limits of a go command.
+        """
+        self.stop()
+        values = {}
+        for name, value in zip(tokens, tokens[1:]):
+            if name in ('depth', 'movetime', 'nodes', 'wtime', 'btime', 'winc', 'binc'):
+                values[name] = int(value)
+        white = self.board.turn == chess.WHITE
+        options = {'time_limit': None}
+        pondering = 'ponder' in tokens
+        if 'depth' in values:
+            options['max_depth'] = values['depth']
+        if 'movetime' in values:
+            options['time_limit'] = values['movetime'] / 1000.0
+        if 'nodes' in values:
+            options['node_limit'] = values['nodes']
+        clock = 'wtime' if white else 'btime'
+        if clock in values:
+            options['remaining'] = values[clock] / 1000.0
+            options['increment'] = values.get('winc' if white else 'binc', 0) / 1000.0
+        self.ponder_limit = None
+        if pondering: # search without limit until ponderhit, which starts the clock of the move
+            self.ponder_limit = options['time_limit']
+            if 'remaining' in options:
+                self.ponder_limit = ai.allocate_time(options.pop('remaining'), options.pop('increment'))[0]
+            options['time_limit'] = None
+        self.stopped = False
+        self.deadline = None
+        self.release = threading.Event()
+        if not pondering and 'infinite' not in tokens:
+            self.release.set()
+        self.thread = threading.Thread(target=self._search, args=(self.board.copy(), white, options))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _search(self, board, white, options):
+        move = ai.ai_move(board, white, info=self._info, **options)
+        if move is None: # stopped before the first iteration completed
+            move = next(iter(board.legal_moves), None)
+        self.release.wait()
+        send('bestmove %s' % (move.uci() if move else '0000'))
+
+    def _info(self, depth, score, pv, nodes, seconds):
+        if self.stopped: # stop came before the search had started
+            ai.search_control.abort()
+        elif self.deadline is not None: # so did ponderhit
+            ai.search_control.deadline = self.deadline
+        send('info depth %d nodes %d nps %d time %d score %s pv %s'
+             % (depth, nodes, nodes / max(seconds, 1e-3), seconds * 1000, score_string(score),
+                ' '.join(move.uci() for move in pv)))
+
+    def stop(self):
+        """
+        Stop the running search, if any; it answers with its best move before this returns.
+        """
+        if self.thread is None:
+            return
+        self.stopped = True
+        ai.search_control.abort()
+        self.release.set()
+        self.thread.join()
+        self.thread = None
+
+    def ponderhit(self):
+        """
+        The expected move was played: the ponder search goes on as the engine's own search, within the time limit of
+        its go command (or without one under a depth or node limit) from now on.
+        """
+        if self.thread is None:
+            return
+        if self.ponder_limit is not None:
+            self.deadline = time.time() + self.ponder_limit
+            ai.search_control.deadline = self.deadline
+        self.release.set()
+
+    def setoption(self, tokens):
+        if 'value' not in tokens:
+            return
+        name = ' '.join(tokens[tokens.index('name') + 1:tokens.index('value')]).lower()
+        value = ' '.join(tokens[tokens.index('value') + 1:])
+        if name == 'hash':
+            self.stop()
+            ai.set_transposition_table(ai.TranspositionTable((int(value) << 20) // TT_ENTRY_BYTES))
+
+    def run(self, stream=sys.stdin):
+        """
+        Read and answer commands until quit or the end of the input.
+        """
+        for line in stream:
+            tokens = line.split()
+            if not tokens:
+                continue
+            command, arguments = tokens[0], tokens[1:]
+            if command == 'uci':
+                send('id name %s' % ENGINE_NAME)
+                send('id author %s' % ENGINE_AUTHOR)
+                send('option name Hash type spin default %d min 1 max 65536' % DEFAULT_HASH)
+                send('uciok')
+            elif command == 'isready':
+                send('readyok')
+            elif command == 'ucinewgame':
+                self.stop()
+                ai.transposition_table.clear()
+                ai.move_ordering.clear()
+            elif command == 'setoption':
+                self.setoption(arguments)
+            elif command == 'position':
+                self.stop()
+                self.position(arguments)
+            elif command == 'go':
+                self.go(arguments)
+            elif command == 'stop':
+                self.stop()
+            elif command == 'ponderhit':
+                self.ponderhit()
+            elif command == 'quit':
+                break
+        self.stop()
+
+if __name__ == "__main__":
+    UCIEngine().run()
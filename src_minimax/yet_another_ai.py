@@ -1,8 +1,22 @@
-from sqlalchemy.orm import sessionmaker
-from tabledef import *
+from tabledef import EvaluationStore
+import bitbase
+import leanboard
 import chess
 import random
-import hashlib
+import numpy as np
+import collections
+import time
+import math
+import itertools
+import json
+import argparse
+import mmap
+import os
+import atexit
+import multiprocessing
+import threading
+import queue
+from multiprocessing import shared_memory
 
 """
 Implementation of a chess engine with the Minimax algorithm and Alpha-beta Pruning.
@@ -10,19 +24,104 @@ Features:
     Real games vs the AI
     Display of the bitboard after every turn
     Minmax algorithm with the AI always playing as the maximizer
-    Database to store past moves and their evaluations using a hash table
-    Holistic evaluation functions: pieces values, number of pieces advantage, piece position, check/checkmate condition.
+    Transposition table keyed by incrementally updated Zobrist hashes, optionally shared between processes
+    Iterative deepening within a per-move time budget, or within a clock with increment
+    Pondering on the expected reply during the human's turn
+    Principal variation search with aspiration windows
+    Null-move pruning and late move reductions
+    Futility pruning, razoring and static exchange evaluation
+    Staged move generation ordered by hash move, MVV-LVA, killer moves and history heuristic
+    Optional parallel search of the root moves across CPU cores
+    Mate solver by depth-first proof-number search
+    Opening book compiled from PGN games, probed before searching
+    Endgame bitbases (KQK, KRK, KPK) solved by retrograde analysis, probed by the search
+    Quiescence search of captures and promotions on a lean array-backed board, the main search on python-chess
+    Database to store past search results, loaded into the transposition table at engine start
+    Holistic evaluation functions: pieces values, number of pieces advantage, piece position, check condition.
+    Checkmate, stalemate, repetition and fifty-move draws detected by the search
+    Piece value and position scores maintained incrementally across push/pop
 Requirements:
     python-chess
     sqlalchemy
+    numpy
 """
 
-# create a database to store moves and their respective evaluation.
-engine = create_engine('sqlite:///chess_db.db')
+# create a database to store positions and their search results.
+store = EvaluationStore()
 
 # initialize constant that would be used in various evaluation steps.
 INF = 100000
 
+# score of checkmate, less one per ply to the mate so that nearer mates score higher. Any score beyond MATE_BOUND is a
+# mate score. Draws (stalemate, repetition, fifty-move rule) score DRAW.
+MATE_SCORE = 50000
+MATE_BOUND = MATE_SCORE - 1000
+DRAW = 0
+
+# material value of each piece type, indexed by python-chess piece type (PAWN = 1 ... KING = 6).
+PIECE_VALUES = [0, 100, 320, 330, 500, 900, 10000]
+
+# safety margin of delta pruning in the quiescence search: a capture must be able to come this close to alpha.
+DELTA_MARGIN = 200
+
+# default think time per move (seconds) and the deepest iteration ai_move would ever start.
+AI_TIME_LIMIT = 5.0
+VERBOSE = False # print every completed iteration of the AI's search in game()
+USE_PONDER = True # search the expected reply while the human thinks
+
+# Time management under a clock. A move gets a soft limit of its share of the clock (remaining / MOVES_TO_GO plus most
+# of the increment), checked between iterations, and a hard limit of at most MAX_TIME_FRACTION of the clock, where the
+# search is stopped. MOVE_OVERHEAD seconds are always kept back so the engine never flags.
+MOVES_TO_GO = 30
+INCREMENT_SHARE = 0.75
+MAX_TIME_FRACTION = 0.3
+HARD_LIMIT_FACTOR = 4
+MOVE_OVERHEAD = 0.1
+NEXT_ITERATION_FRACTION = 0.5 # no new iteration once this fraction of the soft limit is used
+INSTABILITY_FACTOR = 1.5 # soft limit growth each time the best move changes
+FORCED_MOVES = 3 # positions with this few legal moves get FORCED_FACTOR of the time
+FORCED_FACTOR = 0.5
+MATE_FACTOR = 0.25 # once a mate is found
+MAX_DEPTH = 64
+
+# when True, every incremental evaluation is cross-checked against a full recomputation.
+EVAL_DEBUG = False
+
+# results of nodes searched at least STORE_MIN_DEPTH deep are written to the database; the WARM_LOAD_ENTRIES most
+# used ones are loaded into the transposition table at engine start.
+STORE_MIN_DEPTH = 2
+WARM_LOAD_ENTRIES = 100000
+
+# search features, switchable for comparisons. ASPIRATION_WINDOW is the initial half-width of the root window around
+# the previous iteration's score.
+USE_PVS = True
+USE_ASPIRATION = True
+ASPIRATION_WINDOW = 50
+
+# null-move pruning: give the opponent a free move and search NULL_MOVE_REDUCTION plies shallower; if that still fails
+# high the node is cut. From NULL_VERIFY_DEPTH on, the cut is verified by a reduced search without the null move.
+USE_NULL_MOVE = True
+NULL_MOVE_REDUCTION = 2
+NULL_VERIFY_DEPTH = 6
+
+# late move reductions: quiet moves from LMR_MIN_INDEX on are searched shallower, by LMR_REDUCTIONS[depth][index].
+USE_LMR = True
+LMR_MIN_DEPTH = 3
+LMR_MIN_INDEX = 3
+
+# futility pruning and razoring at nodes 1 or 2 plies from the horizon, with margins in piece values indexed by depth:
+# quiet moves are skipped when the static score plus FUTILITY_MARGINS[depth] cannot reach the window, and the node
+# drops straight into the quiescence search when the static score plus RAZOR_MARGINS[depth] cannot.
+USE_FUTILITY = True
+USE_RAZORING = True
+FUTILITY_MARGINS = [0, PIECE_VALUES[chess.BISHOP], PIECE_VALUES[chess.ROOK]]
+RAZOR_MARGINS = [0, PIECE_VALUES[chess.ROOK], PIECE_VALUES[chess.QUEEN]]
+
+# captures that lose material by static exchange evaluation are searched last, skipped in the quiescence search and,
+# near the horizon, skipped when they lose more than SEE_PRUNE_MARGINS[depth].
+USE_SEE_PRUNING = True
+SEE_PRUNE_MARGINS = [0, PIECE_VALUES[chess.PAWN], PIECE_VALUES[chess.KNIGHT]]
+
 # value matrices by positions. E.g. P is the matrix of values by position for white pawns, Pb is for black pawns.
 # Value matrices for white and black are mirrored
 # Matrices are 1D by design for ease of implementation.
@@ -135,9 +234,1070 @@ Kb = [20, 30, 10,  0,  0, 10, 30, 20,
     -30,-40,-40,-50,-50,-40,-40,-30,
     -30,-40,-40,-50,-50,-40,-40,-30]
 
+# Piece values plus position values of every piece on every square, signed from white's point of view, indexed by
+# [color][piece type][square]. Precomputed once so that evaluation is a table lookup. The position matrices above are
+# written rank 8 first, hence the reversal.
+PIECE_SQUARE_TABLES = [[None] * 7, [None] * 7]
+for piece_type, white_table, black_table in [(chess.PAWN, P, Pb), (chess.KNIGHT, N, Nb), (chess.BISHOP, B, Bb),
+                                             (chess.ROOK, R, Rb), (chess.QUEEN, Q, Qb), (chess.KING, K, Kb)]:
+    PIECE_SQUARE_TABLES[chess.WHITE][piece_type] = [PIECE_VALUES[piece_type] + value for value in white_table[::-1]]
+    PIECE_SQUARE_TABLES[chess.BLACK][piece_type] = [-(PIECE_VALUES[piece_type] + value) for value in black_table[::-1]]
+    for color in (chess.WHITE, chess.BLACK):
+        leanboard.PIECE_SQUARE[piece_type | color << 3] = PIECE_SQUARE_TABLES[color][piece_type]
+
+def material_pst(board):
+    """
+    Full computation of the material and piece position score of a board, from white's point of view.
+    """
+    score = 0
+    for square, piece in board.piece_map().items():
+        score += PIECE_SQUARE_TABLES[piece.color][piece.piece_type][square]
+    return score
+
+def piece_changes(board, move):
+    """
+    Helper function: list what a move does to the pieces on the board. Must be called before the move is pushed.
+    Output: (removed, added), two lists of (color, piece type, square).
+    Covers captures, en passant, promotions and castling (king to g/c file, or king takes own rook as in Chess960).
+    """
+    if not move:
+        return [], []
+    turn = board.turn
+    from_square = move.from_square
+    to_square = move.to_square
+    piece_type = board.piece_type_at(from_square)
+    removed = [(turn, piece_type, from_square)]
+    if piece_type == chess.KING and (abs(to_square - from_square) == 2 or
+                                     board.occupied_co[turn] & chess.BB_SQUARES[to_square]):
+        rank = chess.square_rank(from_square)
+        own_rook = board.occupied_co[turn] & chess.BB_SQUARES[to_square]
+        if chess.square_file(to_square) > chess.square_file(from_square):
+            rook_from = to_square if own_rook else chess.square(7, rank)
+            king_to, rook_to = chess.square(6, rank), chess.square(5, rank)
+        else:
+            rook_from = to_square if own_rook else chess.square(0, rank)
+            king_to, rook_to = chess.square(2, rank), chess.square(3, rank)
+        removed.append((turn, chess.ROOK, rook_from))
+        return removed, [(turn, chess.KING, king_to), (turn, chess.ROOK, rook_to)]
+    captured = board.piece_type_at(to_square)
+    if captured:
+        removed.append((not turn, captured, to_square))
+    elif piece_type == chess.PAWN and to_square == board.ep_square:
+        removed.append((not turn, chess.PAWN, to_square - 8 if turn else to_square + 8))
+    return removed, [(turn, move.promotion or piece_type, to_square)]
+
+class Evaluator(object):
+    """
+    Running material and piece position score of a SearchBoard, from white's point of view.
+    SearchBoard calls update() with the piece changes of every move it pushes and undo() on every pop, so reading the
+    score at a leaf costs O(1). In debug mode every read through evaluate() is checked against material_pst(); debug
+    None follows EVAL_DEBUG as it is set at the time of the read.
+    """
+    def __init__(self, board, debug=None):
+        self.debug = debug
+        self.score = material_pst(board)
+        self.stack = []
+
+    def copy(self):
+        evaluator = Evaluator.__new__(Evaluator)
+        evaluator.debug = self.debug
+        evaluator.score = self.score
+        evaluator.stack = list(self.stack)
+        return evaluator
+
+    def update(self, removed, added):
+        self.stack.append(self.score)
+        score = self.score
+        for color, piece_type, square in removed:
+            score -= PIECE_SQUARE_TABLES[color][piece_type][square]
+        for color, piece_type, square in added:
+            score += PIECE_SQUARE_TABLES[color][piece_type][square]
+        self.score = score
+
+    def undo(self):
+        self.score = self.stack.pop()
+
+    def evaluate(self, board):
+        if EVAL_DEBUG if self.debug is None else self.debug:
+            expected = material_pst(board)
+            if expected != self.score:
+                raise AssertionError("incremental evaluation %d != %d after %s in %s"
+                                     % (self.score, expected, board.move_stack[-1:] , board.fen()))
+        return self.score
+
+# Batch evaluation. A position is described by 12 piece bitboards, one per (color, piece type) in the order white pawn,
+# knight, bishop, rook, queen, king, then the same for black. PIECE_SQUARE_ARRAY holds PIECE_SQUARE_TABLES in that order,
+# so the material and position score of N positions is one product of their (N, 12, 64) occupancy with it.
+PIECE_SQUARE_ARRAY = np.array([PIECE_SQUARE_TABLES[color][piece_type]
+                               for color in [chess.WHITE, chess.BLACK] for piece_type in chess.PIECE_TYPES], dtype=np.int32)
+
+def plane(color, piece_type):
+    return (0 if color == chess.WHITE else 6) + piece_type - 1
+
+def piece_bitboards(board):
+    """
+    Output: the 12 piece bitboards of a board, as a list of integers.
+    """
+    return [board.pieces_mask(piece_type, color) for color in [chess.WHITE, chess.BLACK] for piece_type in chess.PIECE_TYPES]
+
+def child_bitboards(board, moves):
+    """
+    Compute the piece bitboards of the positions after each of moves, from the parent's bitboards and the pieces each
+    move changes, without pushing the moves.
+    Output: list of lists of 12 integers, one per move.
+    """
+    parent = piece_bitboards(board)
+    children = []
+    for move in moves:
+        bitboards = list(parent)
+        removed, added = piece_changes(board, move)
+        for color, piece_type, square in removed:
+            bitboards[plane(color, piece_type)] &= ~chess.BB_SQUARES[square]
+        for color, piece_type, square in added:
+            bitboards[plane(color, piece_type)] |= chess.BB_SQUARES[square]
+        children.append(bitboards)
+    return children
+
+def batch_evaluation(bitboards):
+    """
+    Vectorized material and piece position score of many positions at once.
+    Input: bitboards, shape (N, 12) of piece bitboards, e.g. from child_bitboards().
+    Output: numpy array of N scores from white's point of view, equal to material_pst() of each position.
+    """
+    bitboards = np.asarray(bitboards, dtype=np.uint64).astype('<u8')
+    occupancy = np.unpackbits(bitboards.view(np.uint8).reshape(len(bitboards), 12, 8), axis=2, bitorder='little')
+    return np.tensordot(occupancy.astype(np.int32), PIECE_SQUARE_ARRAY, axes=([1, 2], [0, 1]))
+
+def evaluate_children(board, moves):
+    """
+    Material and piece position scores (white's point of view) of the positions after each of moves, in one batch.
+    """
+    if not moves:
+        return []
+    return batch_evaluation(child_bitboards(board, moves)).tolist()
+
+# Zobrist hashing. Every (piece, colour, square), castling corner, en passant file and the side to move gets a random
+# 64-bit key; the hash of a position is the XOR of the keys that apply to it. The generator is seeded so keys are stable
+# between runs. Sources: https://chessprogramming.wikispaces.com/Zobrist+Hashing
+_zobrist_random = random.Random(20180319)
+ZOBRIST_PIECES = [[[_zobrist_random.getrandbits(64) for square in range(64)] for piece_type in range(7)] for color in range(2)]
+ZOBRIST_EP = [_zobrist_random.getrandbits(64) for file in range(8)]
+ZOBRIST_TURN = _zobrist_random.getrandbits(64)
+ZOBRIST_CASTLING = {0: 0} # castling rights bitmask (rook corners) -> key
+for corner in [chess.BB_A1, chess.BB_H1, chess.BB_A8, chess.BB_H8]:
+    corner_key = _zobrist_random.getrandbits(64)
+    for mask, key in list(ZOBRIST_CASTLING.items()):
+        ZOBRIST_CASTLING[mask | corner] = key ^ corner_key
+CASTLING_MASK = chess.BB_A1 | chess.BB_H1 | chess.BB_A8 | chess.BB_H8
+
+def zobrist_hash(board):
+    """
+    Compute the Zobrist key of a position from scratch.
+    Input: board state
+    Output: 64-bit integer key, covering pieces, side to move, castling rights and en passant file.
+    """
+    key = 0
+    for square, piece in board.piece_map().items():
+        key ^= ZOBRIST_PIECES[piece.color][piece.piece_type][square]
+    key ^= ZOBRIST_CASTLING[board.castling_rights & CASTLING_MASK]
+    if board.ep_square is not None:
+        key ^= ZOBRIST_EP[chess.square_file(board.ep_square)]
+    if board.turn == chess.BLACK:
+        key ^= ZOBRIST_TURN
+    return key
+
+class SearchBoard(chess.Board):
+    """
+    python-chess board that keeps the Zobrist key of the current position in board.zobrist and its material and piece
+    position score in board.evaluator. Both are updated incrementally on push() and restored on pop(), so the search
+    never rehashes or re-evaluates a position from scratch.
+    """
+    def __init__(self, fen=chess.STARTING_FEN, chess960=False):
+        chess.Board.__init__(self, fen, chess960=chess960)
+        self.zobrist = zobrist_hash(self)
+        self.zobrist_stack = []
+        self.evaluator = Evaluator(self)
+
+    @classmethod
+    def from_board(cls, board):
+        """
+        Build a SearchBoard from any python-chess board, replaying its move stack so the key history is complete.
+        """
+        search_board = cls(board.root().fen(), chess960=board.chess960)
+        for move in board.move_stack:
+            search_board.push(move)
+        return search_board
+
+    def copy(self, stack=True):
+        board = chess.Board.copy(self, stack=stack)
+        board.zobrist = self.zobrist
+        board.zobrist_stack = list(self.zobrist_stack) if stack else []
+        board.evaluator = self.evaluator.copy()
+        return board
+
+    def set_fen(self, fen):
+        chess.Board.set_fen(self, fen)
+        self.zobrist = zobrist_hash(self)
+        self.zobrist_stack = []
+        self.evaluator = Evaluator(self)
+
+    def push(self, move):
+        key = self.zobrist
+        self.zobrist_stack.append(key)
+        castling = self.castling_rights & CASTLING_MASK
+        if self.ep_square is not None:
+            key ^= ZOBRIST_EP[chess.square_file(self.ep_square)]
+        removed, added = piece_changes(self, move)
+        for color, piece_type, square in removed:
+            key ^= ZOBRIST_PIECES[color][piece_type][square]
+        for color, piece_type, square in added:
+            key ^= ZOBRIST_PIECES[color][piece_type][square]
+        self.evaluator.update(removed, added)
+
+        chess.Board.push(self, move)
+
+        if self.ep_square is not None:
+            key ^= ZOBRIST_EP[chess.square_file(self.ep_square)]
+        self.zobrist = key ^ ZOBRIST_TURN ^ ZOBRIST_CASTLING[castling] ^ ZOBRIST_CASTLING[self.castling_rights & CASTLING_MASK]
+
+    def pop(self):
+        move = chess.Board.pop(self)
+        self.zobrist = self.zobrist_stack.pop()
+        self.evaluator.undo()
+        return move
+
+def encode_move(move):
+    """
+    Helper function: pack a move into an integer (from square, to square and promotion piece, 6 + 6 + 3 bits).
+    None is encoded as 0, which no legal move can be.
+    """
+    if move is None:
+        return 0
+    return move.from_square | (move.to_square << 6) | ((move.promotion or 0) << 12)
+
+def decode_move(code):
+    if not code:
+        return None
+    return chess.Move(code & 63, (code >> 6) & 63, (code >> 12) or None)
+
+# Transposition table. Scores are stored from the point of view of the side to move, together with the depth they were
+# searched to and whether they are exact or only a bound (the search failed high or low).
+EXACT = 0
+LOWERBOUND = 1
+UPPERBOUND = 2
+TT_SIZE = 1 << 20
+
+TTEntry = collections.namedtuple('TTEntry', ['key', 'depth', 'flag', 'score', 'move', 'age'])
+
+class TranspositionTable(object):
+    """
+    Fixed-size hash table of searched positions, indexed by Zobrist key.
+    Each bucket holds two entries: the first is depth-preferred (only replaced by a deeper search, or by anything once it
+    is left over from an earlier search), the second is always replaced.
+    """
+    def __init__(self, size=TT_SIZE):
+        self.buckets = max(1, size // 2)
+        self.entries = [None] * (self.buckets * 2)
+        self.age = 0
+
+    def clear(self):
+        self.entries = [None] * (self.buckets * 2)
+        self.age = 0
+
+    def new_search(self):
+        """
+        Mark all current entries as left over from an earlier search, so that they are the first to be replaced.
+        """
+        self.age += 1
+
+    def probe(self, key):
+        """
+        Look up a position. Output: the TTEntry stored for the key, or None.
+        """
+        index = (key % self.buckets) * 2
+        entry = self.entries[index]
+        if entry is not None and entry.key == key:
+            return entry
+        entry = self.entries[index + 1]
+        if entry is not None and entry.key == key:
+            return entry
+        return None
+
+    def store(self, key, depth, flag, score, move):
+        """
+        Store the result of searching a position.
+        Inputs:
+            key: Zobrist key of the position
+            depth: remaining depth the position was searched to
+            flag: EXACT, LOWERBOUND or UPPERBOUND
+            score: score from the point of view of the side to move
+            move: best move found, or None
+        """
+        index = (key % self.buckets) * 2
+        entry = TTEntry(key, depth, flag, score, move, self.age)
+        preferred = self.entries[index]
+        if preferred is None or preferred.key == key or preferred.age != self.age or depth >= preferred.depth:
+            if move is None and preferred is not None and preferred.key == key:
+                entry = entry._replace(move=preferred.move) # keep the best move we already know for this position
+            self.entries[index] = entry
+        else:
+            self.entries[index + 1] = entry
+
+class SharedTranspositionTable(object):
+    """
+    Transposition table in a fixed-layout array of packed entries that several processes can map at once, either a
+    multiprocessing.shared_memory block (by name) or a memory-mapped file (by path). Same interface and replacement
+    policy as TranspositionTable.
+    Each entry is two 64-bit words: data (score, move, depth, flag, age) and key XOR data. Writers never lock; a reader
+    accepts an entry only if the two words XOR back to the probed key, so an entry torn by a concurrent write reads as a
+    miss rather than as a wrong result.
+    """
+    WORDS = 4 # two entries of two words per bucket
+
+    def __init__(self, size=TT_SIZE, name=None, path=None, create=True):
+        """
+        Inputs:
+            size: number of entries
+            name: shared memory block to create or attach to. Without name or path, a new anonymous block is created.
+            path: file to map instead of shared memory
+            create: False to attach to an existing block or file written by another process
+        """
+        self.buckets = max(1, size // 2)
+        nbytes = self.buckets * self.WORDS * 8
+        self.shm = self.mmap = None
+        if path is not None:
+            if create:
+                with open(path, 'wb') as f:
+                    f.truncate(nbytes)
+            self.file = open(path, 'r+b')
+            self.mmap = mmap.mmap(self.file.fileno(), nbytes)
+            buf = self.mmap
+        else:
+            self.shm = shared_memory.SharedMemory(name=name, create=create, size=nbytes)
+            buf = self.shm.buf
+        self.buf = memoryview(buf)
+        self.words = self.buf.cast('Q')
+        self.age = 0
+        if create:
+            self.clear()
+
+    @property
+    def name(self):
+        return self.shm.name if self.shm is not None else None
+
+    def clear(self):
+        self.buf[:] = bytes(len(self.buf))
+        self.age = 0
+
+    def new_search(self):
+        self.age += 1
+
+    @staticmethod
+    def pack(depth, flag, score, move, age):
+        return ((score + (1 << 31)) & 0xFFFFFFFF) | (encode_move(move) << 32) | (min(max(depth, 0), 255) << 48) | \
+               (flag << 56) | ((age & 63) << 58)
+
+    @staticmethod
+    def unpack(key, data):
+        return TTEntry(key, (data >> 48) & 255, (data >> 56) & 3, (data & 0xFFFFFFFF) - (1 << 31),
+                       decode_move((data >> 32) & 0xFFFF), (data >> 58) & 63)
+
+    def probe(self, key):
+        words = self.words
+        index = (key % self.buckets) * self.WORDS
+        for slot in (index, index + 2):
+            data = words[slot + 1]
+            if words[slot] ^ data == key and data:
+                return self.unpack(key, data)
+        return None
+
+    def store(self, key, depth, flag, score, move):
+        words = self.words
+        index = (key % self.buckets) * self.WORDS
+        data = words[index + 1]
+        preferred_key = words[index] ^ data
+        if (not data or preferred_key == key or ((data >> 58) & 63) != (self.age & 63) or
+                depth >= (data >> 48) & 255):
+            if move is None and data and preferred_key == key:
+                move = decode_move((data >> 32) & 0xFFFF) # keep the best move we already know for this position
+            slot = index
+        else:
+            slot = index + 2
+        data = self.pack(depth, flag, score, move, self.age)
+        words[slot] = key ^ data
+        words[slot + 1] = data
+
+    def load(self, table):
+        """
+        Copy the entries and the age of a TranspositionTable of the same size, each to the same slot.
+        """
+        words = self.words
+        for slot, entry in enumerate(table.entries):
+            if entry is not None:
+                data = self.pack(entry.depth, entry.flag, entry.score, entry.move, entry.age)
+                words[2 * slot] = entry.key ^ data
+                words[2 * slot + 1] = data
+        self.age = table.age
+
+    def close(self, unlink=False):
+        """
+        Unmap the table. The creator of a shared memory block should pass unlink=True once all workers are done.
+        """
+        self.words.release()
+        self.buf.release()
+        if self.shm is not None:
+            self.shm.close()
+            if unlink:
+                self.shm.unlink()
+        else:
+            self.mmap.close()
+            self.file.close()
+
+transposition_table = TranspositionTable()
+
+def set_transposition_table(table):
+    """
+    Make the search use another table, e.g. a SharedTranspositionTable attached to by a worker process.
+    """
+    global transposition_table
+    transposition_table = table
+
+def tt_lookup(board, depth, alpha, beta, is_maximizer):
+    """
+    Helper function: probe the transposition table for the current position.
+    Scores and bounds are converted from the side to move's point of view to the maximizer's.
+    Output: (score, move). score is not None only if the stored result is deep enough to cut off the search at this window.
+    """
+    search_control.tt_probes += 1
+    entry = transposition_table.probe(board.zobrist)
+    if entry is None:
+        return None, None
+    search_control.tt_hits += 1
+    if entry.depth >= depth:
+        score = entry.score
+        if score > MATE_BOUND: # stored as distance from this position, make it distance from the root again
+            score -= move_ordering.ply(board)
+        elif score < -MATE_BOUND:
+            score += move_ordering.ply(board)
+        if is_maximizer:
+            flag = entry.flag
+        else:
+            score, flag = -score, {EXACT: EXACT, LOWERBOUND: UPPERBOUND, UPPERBOUND: LOWERBOUND}[entry.flag]
+        if flag == EXACT or (flag == LOWERBOUND and score >= beta) or (flag == UPPERBOUND and score <= alpha):
+            search_control.tt_cutoffs += 1
+            return score, entry.move
+    return None, entry.move
+
+def tt_save(board, depth, alpha, beta, is_maximizer, score, move):
+    """
+    Helper function: store a search result for the current position. alpha and beta are the window the node was
+    searched with, which determines whether score is exact or a bound. Mate scores are stored as distance to mate
+    from this position, since the same position can be reached at different plies.
+    """
+    if score <= alpha:
+        flag = UPPERBOUND
+    elif score >= beta:
+        flag = LOWERBOUND
+    else:
+        flag = EXACT
+    if not is_maximizer:
+        score = -score
+        flag = {EXACT: EXACT, LOWERBOUND: UPPERBOUND, UPPERBOUND: LOWERBOUND}[flag]
+    if score > MATE_BOUND:
+        score += move_ordering.ply(board)
+    elif score < -MATE_BOUND:
+        score -= move_ordering.ply(board)
+    transposition_table.store(board.zobrist, depth, flag, score, move)
+    if depth >= STORE_MIN_DEPTH:
+        store.put(board.zobrist, depth, flag, score, encode_move(move))
+
+def warm_start():
+    """
+    Helper function: load the most used positions of the database into the transposition table, once per run.
+    """
+    if store.warm_loaded:
+        return
+    for key, depth, flag, score, move in store.warm_load(WARM_LOAD_ENTRIES):
+        transposition_table.store(key, depth, flag, score, decode_move(move))
+
+# Endgame bitbases, generated by bitbase.py into bitbase.BITBASE_DIR. Positions with at most BITBASE_PIECES pieces
+# (kings included) are looked up in them once a table for the material exists.
+USE_BITBASES = True
+BITBASE_PIECES = 4
+bitbases = bitbase.Bitbases(bitbase.BITBASE_DIR)
+
+# Opening book, compiled from PGN games by build_book.py: a binary file of (Zobrist key, encoded move, weight) records
+# sorted by key, so a position is found by binary search over the memory-mapped file without loading it.
+BOOK_FILE = 'opening_book.bin'
+BOOK_RECORD = np.dtype([('key', '<u8'), ('move', '<u4'), ('weight', '<u4')])
+USE_BOOK = True
+
+class OpeningBook(object):
+    """
+    Read-only view of a book file. The file is opened once and memory-mapped; an empty or missing file is an empty book.
+    """
+    def __init__(self, path=BOOK_FILE):
+        self.path = path
+        self.records = None
+        if os.path.exists(path) and os.path.getsize(path) >= BOOK_RECORD.itemsize:
+            self.records = np.memmap(path, dtype=BOOK_RECORD, mode='r')
+        self.random = random.Random()
+
+    def __len__(self):
+        return 0 if self.records is None else len(self.records)
+
+    def entries(self, board):
+        """
+        Output: list of (move, weight) for the position, legal moves only (guards against key collisions).
+        """
+        if self.records is None:
+            return []
+        keys = self.records['key']
+        key = np.uint64(board.zobrist if isinstance(board, SearchBoard) else zobrist_hash(board))
+        low = np.searchsorted(keys, key, side='left')
+        high = np.searchsorted(keys, key, side='right')
+        entries = []
+        for record in self.records[low:high]:
+            move = decode_move(int(record['move']))
+            if board.is_legal(move):
+                entries.append((move, int(record['weight'])))
+        return entries
+
+    def probe(self, board):
+        """
+        Output: a book move for the position, picked at random in proportion to the weights, or None when out of book.
+        """
+        entries = [(move, weight) for move, weight in self.entries(board) if weight > 0]
+        if not entries:
+            return None
+        moves, weights = zip(*entries)
+        return self.random.choices(moves, weights)[0]
+
+book = None
+
+def book_move(board):
+    """
+    Helper function: probe the opening book, opening BOOK_FILE on first use.
+    """
+    global book
+    if not USE_BOOK:
+        return None
+    if book is None:
+        book = OpeningBook(BOOK_FILE)
+    return book.probe(board)
+
+# Static exchange evaluation: the material outcome of the sequence of captures on one square, each side always
+# recapturing with its least valuable piece and free to stop when continuing would lose. Sliding attackers are
+# recomputed from the remaining occupancy, so pieces lined up behind each other (x-rays) join in.
+def attackers_to(board, square, occupied):
+    """
+    Helper function: bitboard of the pieces of both colours attacking square, given the occupancy occupied.
+    """
+    queens_and_rooks = board.queens | board.rooks
+    queens_and_bishops = board.queens | board.bishops
+    attackers = ((chess.BB_KING_ATTACKS[square] & board.kings) |
+                 (chess.BB_KNIGHT_ATTACKS[square] & board.knights) |
+                 (chess.BB_RANK_ATTACKS[square][chess.BB_RANK_MASKS[square] & occupied] & queens_and_rooks) |
+                 (chess.BB_FILE_ATTACKS[square][chess.BB_FILE_MASKS[square] & occupied] & queens_and_rooks) |
+                 (chess.BB_DIAG_ATTACKS[square][chess.BB_DIAG_MASKS[square] & occupied] & queens_and_bishops) |
+                 (chess.BB_PAWN_ATTACKS[chess.BLACK][square] & board.pawns & board.occupied_co[chess.WHITE]) |
+                 (chess.BB_PAWN_ATTACKS[chess.WHITE][square] & board.pawns & board.occupied_co[chess.BLACK]))
+    return attackers & occupied
+
+def exchange(gain, attacker, side, occupied, least_valuable):
+    """
+    Helper function: the exchange on a square after its first capture, shared by see() and lean_see().
+    Inputs:
+        gain: material won by the first capture
+        attacker: type of the piece that made it, now on the square
+        side: colour to recapture
+        occupied: occupancy after the first capture
+        least_valuable: function of (side, occupied) giving (piece type, bitboard of the piece) of the least valuable
+            piece of side that can recapture, or None
+    Output: material won by the side that made the first capture, each side stopping when recapturing would lose.
+    """
+    gains = [gain]
+    while True:
+        recapture = least_valuable(side, occupied)
+        if recapture is None:
+            break
+        gains.append(PIECE_VALUES[attacker] - gains[-1]) # balance for side if the exchange stops after this capture
+        attacker, piece = recapture
+        occupied ^= piece
+        side = not side
+    for i in range(len(gains) - 1, 0, -1): # each side only recaptures if that does not leave it worse off
+        gains[i - 1] = min(gains[i - 1], -gains[i])
+    return gains[0]
+
+def see(board, move):
+    """
+    Static exchange evaluation of a capture (or promotion).
+    Output: material the side to move wins (positive) or loses (negative) on the target square, in piece values.
+    """
+    from_square, to_square = move.from_square, move.to_square
+    piece_type = board.piece_type_at(from_square)
+    occupied = board.occupied ^ chess.BB_SQUARES[from_square]
+    victim = board.piece_type_at(to_square)
+    if victim is None and piece_type == chess.PAWN and to_square == board.ep_square:
+        victim = chess.PAWN
+        occupied ^= chess.BB_SQUARES[to_square - 8 if board.turn else to_square + 8]
+    gain = PIECE_VALUES[victim] if victim else 0
+    attacker = piece_type
+    if move.promotion:
+        gain += PIECE_VALUES[move.promotion] - PIECE_VALUES[chess.PAWN]
+        attacker = move.promotion
+
+    def least_valuable(side, occupied):
+        attackers = attackers_to(board, to_square, occupied)
+        own = attackers & board.occupied_co[side]
+        if not own:
+            return None
+        for piece_type in chess.PIECE_TYPES:
+            candidates = own & board.pieces_mask(piece_type, side)
+            if candidates:
+                break
+        if piece_type == chess.KING and attackers & board.occupied_co[not side]:
+            return None # the king cannot capture into a defended square
+        return piece_type, candidates & -candidates
+    return exchange(gain, attacker, not board.turn, occupied, least_valuable)
+
+def losing_capture(board, move, threshold=0):
+    """
+    Helper function: whether a capture loses more than threshold by SEE. Captures of a piece at least as valuable as
+    the capturer never do, which saves the exchange evaluation for most of them.
+    """
+    victim = board.piece_type_at(move.to_square) or chess.PAWN
+    if PIECE_VALUES[victim] >= PIECE_VALUES[board.piece_type_at(move.from_square)]:
+        return False
+    return see(board, move) < -threshold
+
+# Move ordering. Alpha-beta prunes the most when the best move is searched first, so moves are tried in the order:
+# transposition table move, captures by MVV-LVA (most valuable victim, least valuable attacker), the two killer moves
+# of the ply (quiet moves that caused a cutoff in a sibling node), the other quiet moves by history score, and last the
+# captures that lose material by SEE.
+MAX_PLY = 128
+HASH_MOVE_SCORE = 1 << 30
+CAPTURE_SCORE = 1 << 24
+KILLER_SCORE = 1 << 22
+HISTORY_MAX = 1 << 20
+
+class MoveOrdering(object):
+    """
+    Orders moves at every node, and keeps the killer moves, the butterfly history table (indexed by colour, from-square
+    and to-square) and the statistics on which move index caused each beta cutoff.
+    """
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.killers = [[None, None] for ply in range(MAX_PLY)]
+        self.history = [[[0] * 64 for from_square in range(64)] for color in range(2)]
+        self.root_ply = 0
+        self.reset_statistics()
+
+    def reset_statistics(self):
+        self.cutoffs = 0
+        self.cutoffs_by_index = collections.Counter()
+
+    def new_search(self, board):
+        """
+        Prepare for a search from the given position: killers of the previous search are dropped and history scores
+        are aged so that recent cutoffs count most.
+        """
+        self.root_ply = len(board.move_stack)
+        self.killers = [[None, None] for ply in range(MAX_PLY)]
+        for table in self.history:
+            for row in table:
+                for to_square in range(64):
+                    row[to_square] //= 2
+
+    def ply(self, board):
+        return min(max(len(board.move_stack) - self.root_ply, 0), MAX_PLY - 1)
+
+    def score(self, board, move, ply, hash_move):
+        if move == hash_move:
+            return HASH_MOVE_SCORE
+        if board.is_capture(move):
+            victim = board.piece_type_at(move.to_square) or chess.PAWN # en passant
+            return self.capture_score(victim, board.piece_type_at(move.from_square), lambda: see(board, move))
+        return self.quiet_score(move, move.promotion, self.killers[ply], board.turn, move.from_square, move.to_square)
+
+    @staticmethod
+    def capture_score(victim, attacker, exchange):
+        """
+        Helper function: score of the capture of victim by attacker (piece types) by MVV-LVA. exchange() gives its SEE,
+        only needed when the victim is worth less than the attacker. Negative for a losing capture, which goes after
+        the quiet moves.
+        """
+        if PIECE_VALUES[victim] < PIECE_VALUES[attacker]:
+            value = exchange()
+            if value < 0:
+                return value - KILLER_SCORE
+        return CAPTURE_SCORE + 10 * PIECE_VALUES[victim] - attacker
+
+    def quiet_score(self, move, promotion, killers, turn, from_square, to_square):
+        """
+        Helper function: score of a move that captures nothing. killers are those of the ply, in the representation
+        of move.
+        """
+        if promotion:
+            return CAPTURE_SCORE + PIECE_VALUES[promotion]
+        if move == killers[0]:
+            return KILLER_SCORE + 1
+        if move == killers[1]:
+            return KILLER_SCORE
+        return self.history[turn][from_square][to_square]
+
+    def order(self, board, moves, hash_move=None):
+        """
+        Output: the moves as a list, best candidates first.
+        """
+        ply = self.ply(board)
+        return sorted(moves, key=lambda move: self.score(board, move, ply, hash_move), reverse=True)
+
+    def staged(self, board, hash_move=None):
+        """
+        Generate the legal moves of a position lazily, in stages: the hash move, the captures (and queen promotions)
+        that do not lose material, best victim first, the killer moves, the other quiet moves by history score, and the
+        losing captures. Each stage is only generated when the previous one is used up, and legality is checked per
+        move just before it is handed out, so a node that cuts off early never pays for the rest. When in check, the
+        legal evasions are generated and ordered at once instead.
+        """
+        if board.is_check():
+            for move in self.order(board, board.legal_moves, hash_move):
+                yield move
+            return
+        ply = self.ply(board)
+        tried = []
+        if hash_move is not None and board.is_pseudo_legal(hash_move) and not board.is_into_check(hash_move):
+            tried.append(hash_move)
+            yield hash_move
+
+        captures = []
+        losing = []
+        for move in board.generate_pseudo_legal_captures():
+            if move == hash_move:
+                continue
+            if losing_capture(board, move):
+                losing.append(move)
+            else:
+                victim = board.piece_type_at(move.to_square) or chess.PAWN # en passant
+                captures.append((10 * PIECE_VALUES[victim] + PIECE_VALUES[move.promotion or 0] -
+                                 board.piece_type_at(move.from_square), move))
+        promotion_rank = chess.BB_RANK_7 if board.turn == chess.WHITE else chess.BB_RANK_2
+        for move in board.generate_pseudo_legal_moves(board.pawns & board.occupied_co[board.turn] & promotion_rank, ~board.occupied):
+            if move.promotion == chess.QUEEN and move != hash_move:
+                captures.append((PIECE_VALUES[chess.QUEEN], move))
+        captures.sort(key=lambda capture: capture[0], reverse=True)
+        for score, move in captures:
+            if not board.is_into_check(move):
+                yield move
+
+        for killer in self.killers[ply]:
+            if (killer is not None and killer not in tried and not board.is_capture(killer) and
+                    killer.promotion != chess.QUEEN and board.is_pseudo_legal(killer) and not board.is_into_check(killer)):
+                tried.append(killer)
+                yield killer
+
+        history = self.history[board.turn]
+        quiets = [move for move in itertools.chain(board.generate_pseudo_legal_moves(chess.BB_ALL, ~board.occupied),
+                                                   board.generate_castling_moves())
+                  if move.promotion != chess.QUEEN and move not in tried and not board.is_en_passant(move)]
+        quiets.sort(key=lambda move: history[move.from_square][move.to_square], reverse=True)
+        for move in quiets:
+            if not board.is_into_check(move):
+                yield move
+
+        losing.sort(key=lambda move: see(board, move), reverse=True)
+        for move in losing:
+            if not board.is_into_check(move):
+                yield move
+
+    def cutoff(self, board, move, depth, index):
+        """
+        Record that move (the index-th move searched) caused a beta cutoff at a node searched to the given depth.
+        Quiet moves become killers of the ply and gain history score.
+        """
+        self.cutoffs += 1
+        self.cutoffs_by_index[index] += 1
+        if board.is_capture(move) or move.promotion:
+            return
+        killers = self.killers[self.ply(board)]
+        if move != killers[0]:
+            killers[1] = killers[0]
+            killers[0] = move
+        row = self.history[board.turn][move.from_square]
+        row[move.to_square] += depth * depth
+        if row[move.to_square] > HISTORY_MAX:
+            for table in self.history:
+                for history_row in table:
+                    for to_square in range(64):
+                        history_row[to_square] //= 2
+
+    def first_move_cutoff_rate(self):
+        """
+        Output: fraction of beta cutoffs caused by the first move searched. Close to 1 means near-perfect ordering.
+        """
+        if not self.cutoffs:
+            return 0.0
+        return self.cutoffs_by_index[0] / float(self.cutoffs)
+
+move_ordering = MoveOrdering()
+
+class SearchTimeout(Exception):
+    """
+    Raised inside the search when the time or node budget of the current move is exhausted.
+    """
+    pass
+
+class SearchControl(object):
+    """
+    Node, transposition table and pruning counters and time/node budget of the running search. minimax() calls count_node() at every node
+    and quiescence() calls count_qnode(); both raise SearchTimeout once a budget is exhausted or the search was aborted
+    from another thread. The clock is only read every CHECK_EVERY nodes, and so is shared_abort: in a worker process of
+    the parallel search, the shared flag by which the parent stops the tasks it no longer needs.
+    """
+    CHECK_EVERY = 256
+
+    def __init__(self):
+        self.nodes = 0
+        self.qnodes = 0
+        self.leaves = 0
+        self.tt_probes = 0
+        self.tt_hits = 0
+        self.tt_cutoffs = 0
+        self.prunes = collections.Counter()
+        self.deadline = None
+        self.node_limit = None
+        self.aborted = False
+        self.shared_abort = None
+
+    def start(self, time_limit=None, node_limit=None):
+        """
+        Reset the node counters and set the budget. time_limit is in seconds; None means unlimited.
+        The node budget covers both regular and quiescence nodes.
+        """
+        self.nodes = 0
+        self.qnodes = 0
+        self.leaves = 0
+        self.tt_probes = 0
+        self.tt_hits = 0
+        self.tt_cutoffs = 0
+        self.prunes = collections.Counter()
+        self.deadline = None if time_limit is None else time.time() + time_limit
+        self.node_limit = node_limit
+        self.aborted = False
+
+    def abort(self):
+        """
+        Stop the running search at its next node, whatever its budget.
+        """
+        self.aborted = True
+
+    def stop(self):
+        self.deadline = None
+        self.node_limit = None
+
+    def out_of_budget(self):
+        return ((self.deadline is not None and time.time() >= self.deadline) or
+                (self.node_limit is not None and self.nodes + self.qnodes >= self.node_limit))
+
+    def count_node(self):
+        self.nodes += 1
+        self.check()
+
+    def count_qnode(self):
+        self.qnodes += 1
+        self.check()
+
+    def count_prune(self, kind, depth):
+        """
+        Record a pruning decision: kind is 'null', 'futility', 'razor' or 'see', depth the depth left at the node
+        (0 in the quiescence search).
+        """
+        self.prunes[kind, depth] += 1
+
+    def prunes_by_depth(self):
+        """
+        Output: {kind: {depth: count}} of the pruning decisions of the current search.
+        """
+        table = {}
+        for (kind, depth), count in sorted(self.prunes.items()):
+            table.setdefault(kind, {})[depth] = count
+        return table
+
+    def check(self):
+        total = self.nodes + self.qnodes
+        if self.aborted:
+            raise SearchTimeout()
+        if self.node_limit is not None and total >= self.node_limit:
+            raise SearchTimeout()
+        if total % self.CHECK_EVERY == 0:
+            if self.deadline is not None and time.time() >= self.deadline:
+                raise SearchTimeout()
+            if self.shared_abort is not None and self.shared_abort.value:
+                raise SearchTimeout()
+
+search_control = SearchControl()
+
+class SearchStatistics(object):
+    """
+    Statistics of one AI move, returned by ai_search for tuning: node counts (nodes inside the tree, leaves where the
+    quiescence search takes over, quiescence nodes), transposition table probes, hits and cutoffs, beta cutoffs by the
+    index of the move that caused them, pruning decisions by depth, and depth, nodes, time and score of every completed
+    iteration. source tells how the move was found: 'search', 'book' or 'forced' (the only legal move).
+    """
+    def __init__(self, source='search'):
+        self.source = source
+        self.nodes = 0
+        self.leaves = 0
+        self.qnodes = 0
+        self.tt_probes = 0
+        self.tt_hits = 0
+        self.tt_cutoffs = 0
+        self.cutoffs_by_index = {}
+        self.prunes = {}
+        self.iterations = []
+        self.seconds = 0.0
+
+    def add_iteration(self, depth, score, pv, nodes, seconds):
+        """
+        Record a completed iteration. nodes and seconds are totals since the start of the search.
+        """
+        previous_nodes = self.iterations[-1]['total_nodes'] if self.iterations else 0
+        previous_seconds = self.iterations[-1]['total_seconds'] if self.iterations else 0.0
+        self.iterations.append({'depth': depth, 'score': score, 'pv': [move.uci() for move in pv],
+                                'nodes': nodes - previous_nodes, 'seconds': seconds - previous_seconds,
+                                'total_nodes': nodes, 'total_seconds': seconds})
+
+    def collect(self, control, ordering, seconds):
+        """
+        Copy the counters of the finished search from search_control and move_ordering.
+        """
+        self.nodes = control.nodes
+        self.leaves = control.leaves
+        self.qnodes = control.qnodes
+        self.tt_probes = control.tt_probes
+        self.tt_hits = control.tt_hits
+        self.tt_cutoffs = control.tt_cutoffs
+        self.prunes = control.prunes_by_depth()
+        self.cutoffs_by_index = dict(sorted(ordering.cutoffs_by_index.items()))
+        self.seconds = seconds
+
+    def nps(self):
+        return (self.nodes + self.qnodes) / self.seconds if self.seconds > 0 else 0.0
+
+    def effective_branching_factor(self):
+        """
+        Output: ratio of the nodes of the last completed iteration to those of the one before, None with fewer than two.
+        """
+        if len(self.iterations) < 2 or self.iterations[-2]['nodes'] == 0:
+            return None
+        return self.iterations[-1]['nodes'] / float(self.iterations[-2]['nodes'])
+
+    def to_dict(self):
+        cutoffs = sum(self.cutoffs_by_index.values())
+        return {'source': self.source, 'nodes': self.nodes, 'leaves': self.leaves, 'qnodes': self.qnodes,
+                'seconds': self.seconds, 'nps': self.nps(),
+                'tt': {'probes': self.tt_probes, 'hits': self.tt_hits, 'cutoffs': self.tt_cutoffs},
+                'cutoffs': cutoffs, 'cutoffs_by_index': self.cutoffs_by_index,
+                'first_move_cutoff_rate': self.cutoffs_by_index.get(0, 0) / float(cutoffs) if cutoffs else None,
+                'prunes': self.prunes, 'effective_branching_factor': self.effective_branching_factor(),
+                'iterations': self.iterations}
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.to_dict(), **kwargs)
+
+def principal_variation(board, depth):
+    """
+    Helper function: follow the transposition table's best moves from the current position.
+    Output: list of at most depth moves, the line the search expects to be played.
+    """
+    pv = []
+    seen = set()
+    while len(pv) < depth and board.zobrist not in seen:
+        seen.add(board.zobrist)
+        entry = transposition_table.probe(board.zobrist)
+        if entry is None or entry.move is None or not board.is_legal(entry.move):
+            break
+        pv.append(entry.move)
+        board.push(entry.move)
+    for move in pv:
+        board.pop()
+    return pv
+
+def mated_score(board, is_maximizer):
+    """
+    Helper function: score, for the maximizer, of a position where the side to move is checkmated.
+    """
+    distance = MATE_SCORE - move_ordering.ply(board)
+    return -distance if is_maximizer else distance
+
+def is_draw_by_rule(board):
+    """
+    Helper function: whether the position is drawn by the fifty-move rule or repeats an earlier one. Repetitions are
+    found by comparing Zobrist keys with the positions since the last capture or pawn move, with the same side to
+    move; within the search a single repetition already counts as a draw.
+    """
+    if board.halfmove_clock >= 100:
+        return True
+    key = board.zobrist
+    history = board.zobrist_stack
+    for back in range(2, min(board.halfmove_clock, len(history)) + 1, 2):
+        if history[-back] == key:
+            return True
+    return False
+
+def bitbase_score(board, is_maximizer, ply=None):
+    """
+    Helper function: score, for the maximizer, of a position found in the endgame bitbases (by distance to mate for a
+    won ending), or None if it is not covered. ply is the distance from the root, taken from the board by default.
+    """
+    if not USE_BITBASES or chess.popcount(board.occupied) > BITBASE_PIECES or board.castling_rights:
+        return None
+    outcome = bitbases.probe(board)
+    if outcome is None:
+        return None
+    result, distance = outcome
+    if result == bitbase.DRAW:
+        return DRAW
+    score = MATE_SCORE - (move_ordering.ply(board) if ply is None else ply) - distance
+    if result == bitbase.LOSS:
+        score = -score
+    return score if is_maximizer else -score
+
+def complete_pv(board, pv, depth):
+    """
+    Helper function: extend a principal variation cut short by transposition table hits with the table's best moves.
+    """
+    for move in pv:
+        board.push(move)
+    line = list(pv) + principal_variation(board, depth - len(pv))
+    for move in pv:
+        board.pop()
+    return line
+
+# Triangular table of principal variations: pv_table[ply] is the best line found from the node at that ply.
+pv_table = [[] for ply in range(MAX_PLY + 1)]
+
+# Late move reductions grow with the depth left and with how late the move comes in the ordering.
+LMR_REDUCTIONS = [[0] * 256 for depth in range(MAX_DEPTH + 1)]
+for depth in range(1, MAX_DEPTH + 1):
+    for index in range(1, 256):
+        LMR_REDUCTIONS[depth][index] = max(0, min(depth - 2, int(0.75 + math.log(depth) * math.log(index) / 2.25)))
+
+def null_move_allowed(board, in_check):
+    """
+    Helper function: whether a null move may be tried here. Not when in check, not twice in a row, and not when the
+    side to move only has pawns left, where being forced to move (zugzwang) is common and the null move would lie.
+    """
+    if in_check or (board.move_stack and not board.move_stack[-1]):
+        return False
+    return bool(board.occupied_co[board.turn] & ~(board.pawns | board.kings))
+
 # Implementation of Minimax, including the minimax root, min value, max value and evaluation function based on Norvig/Russell pseudo-codes, 
 # with slight modifications for ease of implementation 
-def minimaxRoot(depth, board, isMaximizer, white):
+def minimaxRoot(depth, board, isMaximizer, white, pv=None):
     """
     The base of minimax functions.
     Inputs:
@@ -145,24 +1305,337 @@ def minimaxRoot(depth, board, isMaximizer, white):
         board: the current state of the game
         isMaximizer: True if max player, False if min player
         white: whether the current player is white or black. True if white, False if black
+        pv: principal variation of a previous, shallower search. Its first move is searched first.
     Outputs: The optimal move the algorithm could find in the search tree, by definition the move with the optimal value x turns ahead.
     """
-    moves = board.legal_moves
+    transposition_table.new_search()
+    move_ordering.new_search(board)
+    value, line = search_root(depth, board, isMaximizer, white, pv)
+    return line[0] if line else None
+
+def search_root(depth, board, isMaximizer, white, pv=None, alpha=-INF, beta=INF, workers=1):
+    """
+    Search the root position within the window (alpha, beta), serially or with a pool of workers.
+    Output: (value, principal variation). The value is a bound if it falls outside the window.
+    With USE_PVS, every move after the first is searched with a null window against the best value so far and only
+    re-searched with the full window when it fails high.
+    """
+    if not isinstance(board, SearchBoard):
+        board = SearchBoard.from_board(board)
+    if workers > 1:
+        return search_root_parallel(depth, board, isMaximizer, white, pv, alpha, beta, workers)
+    moves = root_moves(board, depth, isMaximizer, pv)
     best_val = -INF
-    bestMoveFinal = None
-    for x in moves:
-        move = chess.Move.from_uci(str(x))
+    best_pv = []
+    for index, move in enumerate(moves):
         board.push(move)
-        value = max(best_val, minimax(depth - 1, board,-INF,INF, not isMaximizer, white))
+        if index == 0 or not USE_PVS:
+            value = minimax(depth - 1, board, max(alpha, best_val), beta, not isMaximizer, white)
+        else:
+            value = minimax(depth - 1, board, best_val, best_val + 1, not isMaximizer, white)
+            if best_val < value < beta:
+                value = minimax(depth - 1, board, best_val, beta, not isMaximizer, white)
         board.pop()
         if (value > best_val):
-            print("Best score: " ,str(best_val))
-            print("Best move: ", str(bestMoveFinal))
             best_val = value
-            bestMoveFinal = move
-    return bestMoveFinal
+            best_pv = [move] + pv_table[1]
+        if best_val >= beta:
+            break
+    tt_save(board, depth, alpha, beta, isMaximizer, best_val, best_pv[0] if best_pv else None)
+    return best_val, complete_pv(board, best_pv, depth)
+
+def root_moves(board, depth, isMaximizer, pv=None):
+    """
+    Helper function: the legal moves of board in search order.
+    """
+    score, hash_move = tt_lookup(board, depth, -INF, INF, isMaximizer)
+    return move_ordering.order(board, board.legal_moves, pv[0] if pv else hash_move)
+
+# Mate solver by depth-first proof-number search. The side to move at the root is the attacker: a position is proven
+# when the attacker forces mate from it and disproven when the defender escapes (including by stalemate, repetition or
+# the fifty-move rule). Every position carries a proof number and a disproof number, the least number of positions
+# still to be solved to prove or disprove it; the search always descends into the most promising move until one of
+# the two numbers of a position reaches its threshold. Numbers are kept as (phi, delta), phi being the proof number
+# for the side to move there, so both kinds of nodes are handled alike.
+PN_INF = 1 << 30
+MATE_NODE_LIMIT = 1000000
+MATE_TABLE_SIZE = 1000000
+
+class MateTable(object):
+    """
+    (phi, delta, moves to mate) of the positions visited by the mate solver, keyed by Zobrist key. Holds at most size
+    entries; the least recently stored are dropped first.
+    """
+    def __init__(self, size=MATE_TABLE_SIZE):
+        self.size = size
+        self.entries = collections.OrderedDict()
+
+    def get(self, key):
+        return self.entries.get(key, (1, 1, 0))
+
+    def put(self, key, phi, delta, distance):
+        self.entries[key] = (phi, delta, distance)
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+def mateSearch(board, node_limit=MATE_NODE_LIMIT, table_size=MATE_TABLE_SIZE):
+    """
+    Look for a forced mate by the side to move, by proof-number search instead of full-width minimax.
+    Inputs:
+        board: the current state of the game
+        node_limit: number of positions to expand before giving up
+        table_size: number of positions kept in the table of proof and disproof numbers
+    Outputs: a mating line (the defender resisting as long as the proof allows), or None if there is no forced mate
+    or none was found within the node limit. The search stops at the first proof, so the mate is forced but not
+    necessarily the shortest: a quicker one may go through moves it never had to prove.
+    """
+    if not isinstance(board, SearchBoard):
+        board = SearchBoard.from_board(board)
+    table = MateTable(table_size)
+    attacker = board.turn
+    ply = len(board.move_stack)
+    search_control.start(node_limit=node_limit)
+    try:
+        _mate_mid(board, attacker, table, PN_INF, PN_INF, 0)
+    except SearchTimeout:
+        while len(board.move_stack) > ply:
+            board.pop()
+        return None
+    finally:
+        search_control.stop()
+    phi, delta, distance = table.get(board.zobrist)
+    if phi != 0:
+        return None
+    return mate_line(board, attacker, table)
+
+def _mate_draw(board, attacker):
+    """
+    Helper function: (phi, delta) of a position where the game ends without mate, seen from its side to move.
+    """
+    return (PN_INF, 0) if board.turn == attacker else (0, PN_INF)
+
+def _mate_mid(board, attacker, table, phi_limit, delta_limit, ply):
+    """
+    Helper function: expand board until its phi reaches phi_limit or its delta reaches delta_limit, then store them.
+    """
+    search_control.count_node()
+    children = []
+    for move in board.legal_moves:
+        board.push(move)
+        ended = is_draw_by_rule(board) or ply + 1 >= MAX_PLY
+        children.append((move, board.zobrist, _mate_draw(board, attacker) if ended else None))
+        board.pop()
+    if not children:
+        phi, delta = (PN_INF, 0) if board.is_check() else _mate_draw(board, attacker)
+        table.put(board.zobrist, phi, delta, 0)
+        return
+    while True:
+        phi, delta = PN_INF, 0
+        best, best_phi, best_delta, second_delta = None, 0, PN_INF, PN_INF
+        for move, key, ended in children:
+            child_phi, child_delta = ended or table.get(key)[:2]
+            phi = min(phi, child_delta)
+            delta = min(PN_INF, delta + child_phi)
+            if child_delta < best_delta:
+                best, best_phi, second_delta, best_delta = move, child_phi, best_delta, child_delta
+            elif child_delta < second_delta:
+                second_delta = child_delta
+        if phi >= phi_limit or delta >= delta_limit:
+            break
+        board.push(best)
+        _mate_mid(board, attacker, table, min(PN_INF, delta_limit - delta + best_phi), min(phi_limit, second_delta + 1),
+                  ply + 1)
+        board.pop()
+    entries = [ended + (0,) if ended else table.get(key) for move, key, ended in children]
+    distance = 0
+    if phi == 0: # won for the side to move: by the quickest winning move
+        distance = 1 + min(entry[2] for entry in entries if entry[1] == 0)
+    elif delta == 0: # lost for the side to move: by the slowest move
+        distance = 1 + max(entry[2] for entry in entries)
+    table.put(board.zobrist, phi, delta, distance)
+
+def mate_line(board, attacker, table):
+    """
+    Helper function: follow a proof from the table, the attacker taking the quickest proven mate and the defender the
+    slowest. Only proven moves are known to mate, so the line is a mate but not necessarily the shortest one.
+    """
+    line = []
+    while not board.is_checkmate():
+        if board.turn == attacker:
+            moves = [move for move in board.legal_moves if _mate_child(board, move, table)[1] == 0]
+            choose = min
+        else:
+            moves = list(board.legal_moves)
+            choose = max
+        if not moves:
+            break
+        move = choose(moves, key=lambda move: _mate_child(board, move, table)[2])
+        line.append(move)
+        board.push(move)
+    for move in line:
+        board.pop()
+    return line
+
+def _mate_child(board, move, table):
+    board.push(move)
+    entry = table.get(board.zobrist)
+    board.pop()
+    return entry
+
+# Parallel root search. The worker processes are started once and reused; they share the parent's transposition table
+# through shared memory, and take its age with every task so that all processes agree on which entries are current.
+# A new age also marks a new move, on which a worker drops its killers and ages its history like the parent.
+# Persisting results to the database is left to the parent process. When the parent gives up on an iteration (time out,
+# node limit or stop) it raises _abort, a flag in shared memory that the workers' node counters poll, and waits for the
+# tasks still running to return before it goes on, so that no abandoned task keeps writing to the shared table.
+PARALLEL_WORKERS = max(1, multiprocessing.cpu_count())
+ABORT_POLL = 0.05 # seconds between the parent's checks of its own budget while the workers search
+_pools = {}
+_abort = None
+
+def _init_worker(table_name, table_size, abort):
+    global STORE_MIN_DEPTH
+    STORE_MIN_DEPTH = MAX_DEPTH + 1
+    set_transposition_table(SharedTranspositionTable(table_size, name=table_name, create=False))
+    search_control.shared_abort = abort
+
+def _search_root_move(task):
+    """
+    Worker side of the parallel root search: search one root move against alpha with a null window, and again with
+    the window (alpha, beta) if it fails high.
+    Output: (value, principal variation as UCI strings, nodes, qnodes), value None if the deadline passed or the node
+    budget ran out first.
+    """
+    fen, stack, move, depth, alpha, beta, isMaximizer, white, deadline, node_limit, age = task
+    board = SearchBoard(fen)
+    for uci in stack:
+        board.push(chess.Move.from_uci(uci))
+    if transposition_table.age != age: # the first task of a new move
+        move_ordering.new_search(board)
+        transposition_table.age = age
+    search_control.start(None if deadline is None else max(0.0, deadline - time.time()), node_limit)
+    board.push(chess.Move.from_uci(move))
+    try:
+        value = minimax(depth - 1, board, alpha, alpha + 1, not isMaximizer, white)
+        if alpha < value < beta:
+            value = minimax(depth - 1, board, alpha, beta, not isMaximizer, white)
+    except SearchTimeout:
+        value = None
+    return value, [move] + [reply.uci() for reply in pv_table[1]], search_control.nodes, search_control.qnodes
+
+def worker_pool(workers):
+    """
+    Helper function: the process pool of the given size, created on first use. The first pool moves the search to a
+    SharedTranspositionTable of the same size as the current table, with its entries copied over, that the workers
+    attach to. Pools attached to a table that has since been replaced (e.g. resized by the UCI Hash option) are
+    closed and started again.
+    """
+    if not isinstance(transposition_table, SharedTranspositionTable):
+        shared = SharedTranspositionTable(transposition_table.buckets * 2)
+        shared.load(transposition_table)
+        set_transposition_table(shared)
+        atexit.register(shared.close, True)
+    if workers in _pools and _pools[workers][1] != transposition_table.name:
+        _pools.pop(workers)[0].terminate()
+    if workers not in _pools:
+        global _abort
+        context = multiprocessing.get_context('spawn')
+        if _abort is None:
+            _abort = context.Value('b', 0, lock=False)
+        pool = context.Pool(workers, _init_worker, (transposition_table.name, transposition_table.buckets * 2, _abort))
+        atexit.register(pool.terminate)
+        _pools[workers] = (pool, transposition_table.name)
+    return _pools[workers][0]
+
+def minimaxRootParallel(depth, board, isMaximizer, white, pv=None, workers=PARALLEL_WORKERS):
+    """
+    Parallel version of minimaxRoot, same inputs and output plus the number of worker processes.
+    """
+    transposition_table.new_search()
+    move_ordering.new_search(board)
+    value, line = search_root(depth, board, isMaximizer, white, pv, workers=workers)
+    return line[0] if line else None
+
+def search_root_parallel(depth, board, isMaximizer, white, pv, alpha, beta, workers):
+    """
+    The first root move is searched here to establish alpha; the remaining moves are then searched by the workers
+    against the best value so far with a null window, and re-searched with the full window by the worker when they
+    fail high. The result is the same move as the serial search at the same depth (up to transposition table effects).
+    A move is handed to a worker only when one is free. Under a node limit it takes its share of the nodes left
+    (neither spent nor promised to the moves being searched), so all workers together stay within the limit.
+    """
+    pool = worker_pool(workers)
+    moves = root_moves(board, depth, isMaximizer, pv)
+    if not moves:
+        return -INF, []
+    board.push(moves[0])
+    best_val = minimax(depth - 1, board, alpha, beta, not isMaximizer, white)
+    board.pop()
+    best_pv = [moves[0]] + pv_table[1]
+
+    if best_val < beta:
+        fen = board.root().fen()
+        stack = [move.uci() for move in board.move_stack]
+        pending = collections.deque(moves[1:])
+        done = queue.Queue()
+        running = 0
+        promised = 0
+        try:
+            while pending or running:
+                while pending and running < workers:
+                    budget = None
+                    if search_control.node_limit is not None:
+                        left = search_control.node_limit - search_control.nodes - search_control.qnodes - promised
+                        budget = left // (workers - running)
+                        if budget <= 0:
+                            raise SearchTimeout()
+                        promised += budget
+                    task = (fen, stack, pending.popleft().uci(), depth, max(alpha, best_val), beta, isMaximizer,
+                            white, search_control.deadline, budget, transposition_table.age)
+                    pool.apply_async(_search_root_move, (task,),
+                                     callback=lambda result, budget=budget: done.put((result, budget)),
+                                     error_callback=lambda error: done.put((error, None)))
+                    running += 1
+                result, budget = _next_result(done)
+                running -= 1
+                if isinstance(result, BaseException):
+                    raise result
+                value, line, nodes, qnodes = result
+                search_control.nodes += nodes
+                search_control.qnodes += qnodes
+                promised -= budget or 0
+                search_control.check()
+                if value is None:
+                    raise SearchTimeout()
+                if value > best_val:
+                    best_val = value
+                    best_pv = [chess.Move.from_uci(uci) for uci in line]
+        finally:
+            if running: # stop the tasks still searching and wait for them
+                _abort.value = 1
+                for task in range(running):
+                    result, budget = done.get()
+                    if not isinstance(result, BaseException):
+                        search_control.nodes += result[2]
+                        search_control.qnodes += result[3]
+                _abort.value = 0
+    tt_save(board, depth, alpha, beta, isMaximizer, best_val, best_pv[0])
+    return best_val, complete_pv(board, best_pv, depth)
 
-def minimax(depth, board, alpha, beta, is_maximizer, white):
+def _next_result(done):
+    """
+    Helper function: wait for the next (result, budget) of the workers on the queue done, raising SearchTimeout as
+    soon as the parent's own search is aborted or out of budget.
+    """
+    while True:
+        try:
+            return done.get(timeout=ABORT_POLL)
+        except queue.Empty:
+            if search_control.aborted or search_control.out_of_budget():
+                raise SearchTimeout()
+
+def minimax(depth, board, alpha, beta, is_maximizer, white, allow_null=True):
     """
     Implementation of the minimax algorithm as a recursion function.
     Inputs:
@@ -173,76 +1646,304 @@ def minimax(depth, board, alpha, beta, is_maximizer, white):
         white: whether the current player is white or black
     Outputs: the optimal move for the current state of the board.
     Separated from the function above as MinimaxRoot loops through all states to find the optimal move.
+    The transposition table is probed first: a stored result that is deep enough and fits the window is returned as is,
+    otherwise the moves are generated stage by stage by move_ordering, the stored best move first.
+    With USE_PVS (principal variation search) only the first move gets the full window; the others are searched with a
+    null window that can only tell whether they beat the first, and re-searched with the full window if they do.
+    With USE_NULL_MOVE, a node whose static score is already past the window is first searched shallower after passing
+    the move (allow_null=False disables this). With USE_LMR, late quiet moves are searched shallower, and re-searched
+    at full depth if they unexpectedly beat the window. One or two plies from the horizon, razoring, futility pruning
+    and SEE pruning skip nodes and moves whose static score is too far from the window to matter.
+    The best line found is left in pv_table. Repetitions and the fifty-move rule are recognised from the Zobrist key
+    history, and a node without legal moves scores as checkmate (by distance to mate) or stalemate. Below the root,
+    endings covered by the bitbases are scored from them without searching.
     """
+    search_control.count_node()
+    ply = move_ordering.ply(board)
+    pv_table[ply] = []
+    if ply > 0 and is_draw_by_rule(board):
+        return DRAW
+    if ply > 0:
+        score = bitbase_score(board, is_maximizer)
+        if score is not None:
+            return score
+    score, hash_move = tt_lookup(board, depth, alpha, beta, is_maximizer)
+    if score is not None:
+        return score
     if(depth == 0):
-        if white:
-            return evaluation(board, white)
-        else:
-            return -evaluation(board, white)
-    moves = board.legal_moves
-    if(is_maximizer):
-        bestMove = -INF
-        for x in moves:
-            move = chess.Move.from_uci(str(x))
-            board.push(move)
-            bestMove = max(bestMove,minimax(depth - 1, board,alpha,beta, not is_maximizer, white))
+        search_control.leaves += 1
+        score = quiescence(board, alpha, beta, is_maximizer, white)
+        tt_save(board, 0, alpha, beta, is_maximizer, score, None)
+        return score
+    alpha_orig, beta_orig = alpha, beta
+    in_check = board.is_check()
+    if (USE_NULL_MOVE and allow_null and depth >= NULL_MOVE_REDUCTION + 1 and beta - alpha == 1 and
+            null_move_allowed(board, in_check)):
+        static = board.evaluator.evaluate(board)
+        static = static if white else -static
+        if (is_maximizer and static >= beta) or (not is_maximizer and static <= alpha):
+            board.push(chess.Move.null())
+            value = minimax(depth - 1 - NULL_MOVE_REDUCTION, board, alpha, beta, not is_maximizer, white)
             board.pop()
-            alpha = max(alpha,bestMove)
-            if beta <= alpha:
-                return bestMove
-        return bestMove
-    else:
-        bestMove = INF
-        for x in moves:
-            move = chess.Move.from_uci(str(x))
-            board.push(move)
-            bestMove = min(bestMove, minimax(depth - 1, board,alpha,beta, not is_maximizer, white))
+            if (is_maximizer and value >= beta) or (not is_maximizer and value <= alpha):
+                if depth >= NULL_VERIFY_DEPTH:
+                    value = minimax(depth - NULL_MOVE_REDUCTION, board, alpha, beta, is_maximizer, white, False)
+                if (is_maximizer and value >= beta) or (not is_maximizer and value <= alpha):
+                    search_control.count_prune('null', depth)
+                    cutoff = beta if is_maximizer else alpha
+                    tt_save(board, depth, alpha_orig, beta_orig, is_maximizer, cutoff, None)
+                    return cutoff
+
+    futile = False
+    if depth < len(FUTILITY_MARGINS) and beta - alpha == 1 and not in_check:
+        static = board.evaluator.evaluate(board)
+        static = static if white else -static
+        if USE_RAZORING and ((is_maximizer and static + RAZOR_MARGINS[depth] <= alpha) or
+                             (not is_maximizer and static - RAZOR_MARGINS[depth] >= beta)):
+            value = quiescence(board, alpha, beta, is_maximizer, white)
+            if (is_maximizer and value <= alpha) or (not is_maximizer and value >= beta):
+                search_control.count_prune('razor', depth)
+                return value
+        futile = USE_FUTILITY and ((is_maximizer and static + FUTILITY_MARGINS[depth] <= alpha) or
+                                   (not is_maximizer and static - FUTILITY_MARGINS[depth] >= beta))
+
+    moves = move_ordering.staged(board, hash_move)
+    killers = move_ordering.killers[ply]
+    best_move = None
+    bestMove = -INF if is_maximizer else INF
+    legal_moves = 0
+    for index, move in enumerate(moves):
+        legal_moves += 1
+        capture = board.is_capture(move)
+        if (USE_SEE_PRUNING and capture and depth < len(SEE_PRUNE_MARGINS) and index > 0 and not in_check and
+                losing_capture(board, move, SEE_PRUNE_MARGINS[depth])):
+            search_control.count_prune('see', depth)
+            continue
+        reduction = 0
+        if (USE_LMR and depth >= LMR_MIN_DEPTH and index >= LMR_MIN_INDEX and not in_check and not capture and
+                not move.promotion and move not in killers):
+            reduction = LMR_REDUCTIONS[depth][min(index, 255)]
+        board.push(move)
+        if futile and index > 0 and not capture and not move.promotion and not board.is_check():
             board.pop()
+            search_control.count_prune('futility', depth)
+            if is_maximizer: # the most the skipped move is taken to be worth, so the node's bound stays sound
+                bestMove = max(bestMove, static + FUTILITY_MARGINS[depth])
+            else:
+                bestMove = min(bestMove, static - FUTILITY_MARGINS[depth])
+            continue
+        if reduction and board.is_check():
+            reduction = 0
+        if index == 0:
+            value = minimax(depth - 1, board,alpha,beta, not is_maximizer, white)
+        else:
+            if not USE_PVS:
+                low, high = alpha, beta
+            elif(is_maximizer):
+                low, high = alpha, alpha + 1
+            else:
+                low, high = beta - 1, beta
+            value = minimax(depth - 1 - reduction, board, low, high, not is_maximizer, white)
+            if reduction and ((is_maximizer and value > alpha) or (not is_maximizer and value < beta)):
+                value = minimax(depth - 1, board, low, high, not is_maximizer, white)
+            if USE_PVS and alpha < value < beta:
+                value = minimax(depth - 1, board, alpha, beta, not is_maximizer, white)
+        board.pop()
+        if(is_maximizer):
+            if value > bestMove:
+                bestMove, best_move = value, move
+                if value > alpha:
+                    pv_table[ply] = [move] + pv_table[ply + 1]
+            alpha = max(alpha,bestMove)
+        else:
+            if value < bestMove:
+                bestMove, best_move = value, move
+                if value < beta:
+                    pv_table[ply] = [move] + pv_table[ply + 1]
             beta = min(beta,bestMove)
-            if(beta <= alpha):
-                return bestMove
-        return bestMove
+        if(beta <= alpha):
+            move_ordering.cutoff(board, move, depth, index)
+            break
+    if not legal_moves: # checkmate or stalemate, found where the moves are generated anyway
+        bestMove = mated_score(board, is_maximizer) if in_check else DRAW
+    tt_save(board, depth, alpha_orig, beta_orig, is_maximizer, bestMove, best_move)
+    return bestMove
 
-def evaluation(board, white):
+def quiescence(board, alpha, beta, is_maximizer, white):
     """
-    Evaluation functions. Including 3 heuristics: difference in piece value, difference in piece positions, and check/checkmate evaluation.
-    The algorithm first search if a move is in the database. If yes, retrieve the move's value. If no, evaluate the position and insert the data into the database.
+    Quiescence search: at the horizon of minimax, keep searching captures and promotions until the position is quiet,
+    so that the static evaluation is never taken in the middle of an exchange.
+    Inputs: same as minimax, without the depth.
+    Output: the value of the position for the maximizer.
+    The side to move may always "stand pat" on the static evaluation instead of capturing. Captures that could not
+    bring the score back to the window even by winning the captured piece plus DELTA_MARGIN are skipped (delta pruning),
+    and so are captures that lose material by SEE. A node that fails low (high for the minimizer) by delta pruning
+    returns the most its skipped captures could be worth rather than the stand pat score, so that the bound it leaves
+    in the transposition table and in the caller's null-window tests is never tighter than the search justifies.
+    When in check, all evasions are searched instead. Endings covered by the bitbases are scored from them.
+    The search runs on lean_position, a leanboard.Position loaded with the horizon position (see lean_quiescence).
+    Most horizon nodes stand pat at once, so that cutoff is taken on the board itself, before the position is loaded.
     """
-    i = 0
-    evaluation = 0
-    x = True
-    h = hashlib.sha256()
-    h.update(str(board).encode('utf-8'))
+    static = board.evaluator.evaluate(board) if isinstance(board, SearchBoard) else material_pst(board)
+    stand_pat = static if white else -static
+    if ((stand_pat >= beta if is_maximizer else stand_pat <= alpha) and
+            chess.popcount(board.occupied) > BITBASE_PIECES and not board.is_check()):
+        search_control.count_qnode()
+        return stand_pat
+    position = lean_position.load(board, static)
+    return lean_quiescence(position, alpha, beta, is_maximizer, white, move_ordering.ply(board))
+
+# Quiescence search board. Most of the nodes of a search are quiescence nodes, so at the horizon the position is loaded
+# once into a leanboard.Position and the captures are searched there: integer moves, push/pop in place and precomputed
+# attack tables instead of python-chess Move objects and board bookkeeping. The exchange evaluation and the move
+# scores are those of the main search, fed from the lean board. The main search itself stays on SearchBoard, so the
+# lean board only speeds up the quiescence part of the search (about 40% of its time at depth 5).
+lean_position = leanboard.Position(None)
 
-    Session = sessionmaker(bind=engine)
-    s = Session()
-    query = s.query(Moves).filter(Moves.state==h.hexdigest())
-    result = query.first()
+def lean_evaluate(position):
+    """
+    The running score of a leanboard.Position, checked against a full recomputation with EVAL_DEBUG as
+    Evaluator.evaluate().
+    """
+    if EVAL_DEBUG:
+        expected = sum(leanboard.PIECE_SQUARE[code][square] for square, code in enumerate(position.board))
+        if expected != position.score:
+            raise AssertionError("incremental evaluation %d != %d on the lean board after %s"
+                                 % (position.score, expected, leanboard.move_uci(position.undo_move[position.ply - 1])
+                                    if position.ply else None))
+    return position.score
 
-    if result:
-        return result.value
+def lean_see(position, move):
+    """
+    Static exchange evaluation of an integer move on a leanboard.Position, as see().
+    """
+    origin, target, promotion = move & 63, move >> 6 & 63, move >> 12
+    board = position.board
+    piece_type = board[origin] & 7
+    occupied = (position.occ[0] | position.occ[1]) ^ leanboard.BB[origin]
+    victim = board[target] & 7
+    if not victim and piece_type == chess.PAWN and target == position.ep:
+        victim = chess.PAWN
+        occupied ^= leanboard.BB[target - 8 if position.turn else target + 8]
+    gain = PIECE_VALUES[victim]
+    attacker = piece_type
+    if promotion:
+        gain += PIECE_VALUES[promotion] - PIECE_VALUES[chess.PAWN]
+        attacker = promotion
+
+    def least_valuable(side, occupied):
+        attackers = position.attackers(target, side, occupied)
+        if not attackers:
+            return None
+        for piece_type in chess.PIECE_TYPES:
+            candidates = attackers & position.bb[piece_type | side << 3]
+            if candidates:
+                break
+        if piece_type == chess.KING and position.attackers(target, not side, occupied):
+            return None
+        return piece_type, candidates & -candidates
+    return exchange(gain, attacker, not position.turn, occupied, least_valuable)
+
+def lean_order(position, moves, ply, losing):
+    """
+    Output: the integer moves best candidates first, scored as MoveOrdering.score() without a hash move. The
+    captures that lose material by SEE are added to the set losing, so that their exchange is evaluated once.
+    """
+    board = position.board
+    killers = [encode_move(killer) if killer else -1 for killer in move_ordering.killers[ply]]
+
+    def score(move):
+        origin, target = move & 63, move >> 6 & 63
+        victim = board[target] & 7
+        if victim or (target == position.ep and board[origin] & 7 == chess.PAWN):
+            value = move_ordering.capture_score(victim or chess.PAWN, board[origin] & 7,
+                                                lambda: lean_see(position, move))
+            if value < 0:
+                losing.add(move)
+            return value
+        return move_ordering.quiet_score(move, move >> 12, killers, position.turn, origin, target)
+    return sorted(moves, key=score, reverse=True)
+
+def lean_quiescence(position, alpha, beta, is_maximizer, white, ply):
+    """
+    Helper function: the recursion of quiescence() on a leanboard.Position. ply is the distance of the position from
+    the root, for the killer moves and the mate and bitbase scores.
+    """
+    search_control.count_qnode()
+    ply = min(ply, MAX_PLY - 1)
+    score = bitbase_score(position, is_maximizer, ply)
+    if score is not None:
+        return score
+    in_check = position.is_check()
+    losing = set()
+    if in_check:
+        moves = lean_order(position, position.legal_moves, ply, losing)
+        best = -INF if is_maximizer else INF
     else:
-        for i in range(64):
-            try:
-                x = bool(board.piece_at(i).color)
-            except AttributeError as e:
-                x = x
-            evaluation += (getPieceValue(str(board.piece_at(i)),i) if x else -getPieceValue(str(board.piece_at(i)),i))
-    
-        if board.is_check():
-            if white == board.turn:
-                evaluation -= 400
-            else:
-                evaluation += 400 # arbitrary value
-        if board.is_checkmate():
-            if white == board.turn:
-                evaluation -= 10000
-            else:
-                evaluation += 10000
-        new_move = Moves(h.hexdigest(), evaluation)
-        s.add(new_move)
-        s.commit()
-        return evaluation
+        static = lean_evaluate(position)
+        stand_pat = static if white else -static
+        best = stand_pat
+        if(is_maximizer):
+            if stand_pat >= beta:
+                return stand_pat
+            if stand_pat + PIECE_VALUES[chess.QUEEN] + DELTA_MARGIN < alpha:
+                return stand_pat + PIECE_VALUES[chess.QUEEN] + DELTA_MARGIN
+            alpha = max(alpha, stand_pat)
+        else:
+            if stand_pat <= alpha:
+                return stand_pat
+            if stand_pat - PIECE_VALUES[chess.QUEEN] - DELTA_MARGIN > beta:
+                return stand_pat - PIECE_VALUES[chess.QUEEN] - DELTA_MARGIN
+            beta = min(beta, stand_pat)
+        moves = lean_order(position, position.legal(position.generate(tactical=True)), ply, losing)
+
+    board = position.board
+    for move in moves:
+        if not in_check and not move >> 12:
+            gain = PIECE_VALUES[board[move >> 6 & 63] & 7 or chess.PAWN] + DELTA_MARGIN
+            if is_maximizer and stand_pat + gain < alpha:
+                best = max(best, stand_pat + gain) # the most the skipped capture could be worth
+                continue
+            if not is_maximizer and stand_pat - gain > beta:
+                best = min(best, stand_pat - gain)
+                continue
+            if USE_SEE_PRUNING and move in losing:
+                search_control.count_prune('see', 0)
+                continue
+        position.push(move)
+        value = lean_quiescence(position, alpha, beta, not is_maximizer, white, ply + 1)
+        position.pop()
+        if(is_maximizer):
+            best = max(best, value)
+            alpha = max(alpha, best)
+        else:
+            best = min(best, value)
+            beta = min(beta, best)
+        if(beta <= alpha):
+            break
+    if in_check and best in (INF, -INF):
+        distance = MATE_SCORE - ply
+        best = -distance if is_maximizer else distance
+    return best
+
+def evaluation(board, white):
+    """
+    Evaluation functions. Including 3 heuristics: difference in piece value, difference in piece positions, and check evaluation.
+    Scores are from white's point of view. On a SearchBoard the piece value and position terms are maintained
+    incrementally by board.evaluator, so only the check term is computed here. Checkmate and stalemate are scored by
+    the search, which finds them when it generates the moves of a node.
+    """
+    if isinstance(board, SearchBoard):
+        evaluation = board.evaluator.evaluate(board)
+    else:
+        evaluation = material_pst(board)
+
+    if board.is_check():
+        if board.turn == chess.WHITE:
+            evaluation -= 400 # arbitrary value
+        else:
+            evaluation += 400
+    return evaluation
 
 
 def getPieceValue(piece, i):
@@ -253,32 +1954,11 @@ def getPieceValue(piece, i):
         i: position of the piece. (board in python-chess is an 1D array)
     Output: evaluation as a float value.
     """
-    if piece == "P":
-        return 100 + P[::-1][i]
-    if piece == "p":
-        return 100 + Pb[::-1][i]
-    if piece == "N":
-        return 320 + N[::-1][i]
-    if piece == "n":
-        return 320 + Nb[::-1][i]
-    if piece == "B":
-        return 330 + B[::-1][i]
-    if piece == "b":
-        return 330 + Bb[::-1][i]
-    if piece == "R":
-        return 500 + R[::-1][i]
-    if piece == "r":
-        return 500 + Rb[::-1][i]
-    if piece == "Q":
-        return 900 + Q[::-1][i]
-    if piece == "q":
-        return 900 + Qb[::-1][i]
-    if piece == "K":
-        return 10000 + K[::-1][i]
-    if piece == "k":
-        return 10000 + Kb[::-1][i]
-    else:
+    try:
+        piece = chess.Piece.from_symbol(piece)
+    except (ValueError, KeyError):
         return 0
+    return abs(PIECE_SQUARE_TABLES[piece.color][piece.piece_type][i])
 
 def user_move(board):
     """
@@ -296,18 +1976,217 @@ def user_move(board):
         except:
             print ("Illegal move. Please try again.")
 
-def ai_move(board, white):
+def aspiration_search(depth, board, white, score, pv, workers=1):
+    """
+    Helper function: search the root in a window of ASPIRATION_WINDOW around the score of the previous iteration. When
+    the result falls outside the window it is only a bound, so the window is widened on that side and the root is
+    searched again.
+    Output: (value, principal variation)
+    """
+    delta = ASPIRATION_WINDOW
+    if not USE_ASPIRATION or score is None or depth < 3:
+        alpha, beta = -INF, INF
+    else:
+        alpha, beta = max(-INF, score - delta), min(INF, score + delta)
+    while True:
+        value, line = search_root(depth, board, True, white, pv, alpha, beta, workers)
+        if value <= alpha and alpha > -INF:
+            delta *= 4
+            alpha = max(-INF, value - delta)
+        elif value >= beta and beta < INF:
+            delta *= 4
+            beta = min(INF, value + delta)
+        else:
+            return value, line
+
+def print_info(depth, score, pv, nodes, seconds):
+    """
+    Helper function: display the result of one iteration of the search.
+    """
+    print("depth %d score %d nodes %d time %.2f pv %s" % (depth, score, nodes, seconds, " ".join(move.uci() for move in pv)))
+
+def allocate_time(remaining, increment=0.0, moves_to_go=MOVES_TO_GO):
+    """
+    Helper function: time budget of a move under a clock.
+    Inputs: seconds left on the clock, seconds added per move, number of moves the remaining time has to last.
+    Output: (soft limit, hard limit) in seconds.
+    """
+    available = max(0.0, remaining - MOVE_OVERHEAD)
+    soft = min(available, available / moves_to_go + increment * INCREMENT_SHARE)
+    hard = min(available, max(soft, min(soft * HARD_LIMIT_FACTOR, available * MAX_TIME_FRACTION)))
+    return soft, hard
+
+def ai_move(board, white, time_limit=AI_TIME_LIMIT, node_limit=None, max_depth=MAX_DEPTH, workers=1, info=None,
+            remaining=None, increment=0.0):
     """
     Helper function: Initialize the minimax algorithm to and return AI's move
+    Same inputs as ai_search, which also returns the statistics of the search.
+    """
+    return ai_search(board, white, time_limit, node_limit, max_depth, workers, info, remaining, increment)[0]
+
+def ai_search(board, white, time_limit=AI_TIME_LIMIT, node_limit=None, max_depth=MAX_DEPTH, workers=1, info=None,
+              remaining=None, increment=0.0):
+    """
+    Search the AI's move.
+    Output: (move, SearchStatistics of the search).
+    The search runs by iterative deepening: depth 1, 2, 3, ... until the time budget (seconds) or the node budget runs
+    out. The iteration in progress is then abandoned and the move of the last completed iteration is returned. Each
+    iteration searches the previous principal variation first, within an aspiration window around its score.
+    Depth 1 always runs to completion.
+    With workers > 1, the root moves are searched in parallel.
+    Positions in the opening book are answered from the book without searching.
+    With remaining (seconds left on the AI's clock) and increment, time_limit is replaced by the clock's allocation
+    (allocate_time): the search stops at the hard limit, and no new iteration starts past a share of the soft limit.
+    The soft limit grows each time the best move changes, and shrinks when there are few legal moves or a mate is
+    found; a single legal move is played at once.
+    info, if given, is called as info(depth, score, pv, nodes, seconds) after every completed iteration.
+    """
+    if not isinstance(board, SearchBoard):
+        board = SearchBoard.from_board(board)
+    start = time.time()
+    move = book_move(board)
+    if move is not None:
+        return move, SearchStatistics('book')
+    soft = None
+    if remaining is not None:
+        moves = list(board.legal_moves)
+        if len(moves) == 1:
+            return moves[0], SearchStatistics('forced')
+        soft, time_limit = allocate_time(remaining, increment)
+        if len(moves) <= FORCED_MOVES:
+            soft *= FORCED_FACTOR
+    warm_start()
+    transposition_table.new_search() # once per move: the iterations and re-searches of this one share the age,
+    move_ordering.new_search(board) # the killers and the history
+    deadline = None if time_limit is None else start + time_limit
+    ply = len(board.move_stack)
+    min_move = None
+    score = None
+    pv = []
+    statistics = SearchStatistics()
+    search_control.start()
+    move_ordering.reset_statistics()
+    try:
+        for depth in range(1, max_depth + 1):
+            try:
+                score, pv = aspiration_search(depth, board, white, score, pv, workers)
+            except SearchTimeout:
+                while len(board.move_stack) > ply: # unwind the abandoned iteration
+                    board.pop()
+                break
+            previous, min_move = min_move, pv[0] if pv else None
+            nodes, seconds = search_control.nodes + search_control.qnodes, time.time() - start
+            statistics.add_iteration(depth, score, pv, nodes, seconds)
+            if info is not None and pv:
+                info(depth, score, pv, nodes, seconds)
+            if depth == 1: # budgets apply from the second iteration on
+                if deadline is not None:
+                    search_control.deadline = deadline
+                if node_limit is not None:
+                    search_control.node_limit = node_limit
+            if min_move is None or search_control.out_of_budget():
+                break
+            if soft is not None:
+                if previous is not None and min_move != previous:
+                    soft = min(time_limit, soft * INSTABILITY_FACTOR)
+                limit = soft * MATE_FACTOR if abs(score) > MATE_BOUND else soft
+                if time.time() - start >= limit * NEXT_ITERATION_FRACTION:
+                    break
+    finally:
+        search_control.stop()
+        statistics.collect(search_control, move_ordering, time.time() - start)
+    return min_move, statistics
+
+class Ponderer(object):
+    """
+    Pondering: while the human thinks, a background thread searches the position after the reply the AI expects (the
+    second move of its principal variation), filling the transposition table. If the human plays the expected move
+    (ponder hit) that search simply carries on as the AI's search, its time budget counted from when pondering began,
+    so the answer is usually ready at once. On any other move it is stopped and its result discarded.
     """
-    min_move = minimaxRoot(3,board,True,white)
-    return min_move
+    def __init__(self, time_limit=AI_TIME_LIMIT):
+        self.time_limit = time_limit
+        self.thread = None
+
+    def start(self, board, white):
+        """
+        Start pondering after the AI's move was pushed on board. white is the AI's colour.
+        """
+        expected = principal_variation(board, 1)
+        if not expected:
+            return
+        self.expected = expected[0]
+        self.board = board.copy()
+        self.board.push(self.expected)
+        self.key = self.board.zobrist # the search thread moves self.board around
+        self.white = white
+        self.begin = time.time()
+        self.deadline = None
+        self.stopped = False
+        self.depth = 0
+        self.move = None
+        self.thread = threading.Thread(target=self._search)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _search(self):
+        self.move = ai_move(self.board, self.white, time_limit=None, info=self._iteration)
+
+    def _iteration(self, depth, score, pv, nodes, seconds):
+        self.depth = depth
+        if self.stopped:
+            search_control.abort()
+        elif self.deadline is not None:
+            search_control.deadline = self.deadline
 
-def game():
+    def finish(self, board, time_limit=None):
+        """
+        Stop pondering once the human's move is pushed on board. time_limit, if given, replaces the ponderer's.
+        Output: the AI's move on a ponder hit, None on a miss or if nothing was pondered.
+        """
+        if self.thread is None:
+            return None
+        hit = board.zobrist == self.key
+        if hit:
+            self.deadline = self.begin + (self.time_limit if time_limit is None else time_limit)
+            if self.depth: # the first iteration always completes
+                search_control.deadline = self.deadline
+        else:
+            self.stopped = True
+            search_control.abort()
+        self.thread.join()
+        self.thread = None
+        return self.move if hit else None
+
+    def stop(self):
+        """
+        Stop pondering and discard its result, e.g. when the game ends on the human's move.
+        """
+        if self.thread is None:
+            return
+        self.stopped = True
+        search_control.abort()
+        self.thread.join()
+        self.thread = None
+
+def bot_move(board, white, ponderer=None, remaining=None, increment=0.0):
+    """
+    Helper function: the AI's move in game(), the pondered answer on a ponder hit and a new search otherwise, within
+    the AI's clock if there is one.
+    """
+    time_limit = None if remaining is None else allocate_time(remaining, increment)[0]
+    move = ponderer.finish(board, time_limit) if ponderer else None
+    if move is None:
+        move = ai_move(board, white, info=print_info if VERBOSE else None, remaining=remaining, increment=increment)
+    return move
+
+def game(clock=None, increment=0.0):
     """
     Main game engine. Initialize board, determine whether the human or the AI start first, and check for terminating conditions (checkmate/ stalemate/ etc...)
+    clock: seconds on each side's clock (None plays without a clock, AI_TIME_LIMIT per AI move); increment: seconds
+    added after every move.
     """
-    board = chess.Board() # initialize board
+    board = SearchBoard() # initialize board
 
     if random.choice([0,1]): # determine whose turn is whose
         turn_dict = {'white':'user', 'black':'bot'}
@@ -315,38 +2194,62 @@ def game():
         turn_dict = {'white':'bot', 'black':'user'}
 
     white = True # keep track of the current player
+    ponderer = Ponderer() if USE_PONDER else None
+    clocks = {chess.WHITE: clock, chess.BLACK: clock}
 
-    while True:
-        print(board) # display board
+    try:
+        while True:
+            print(board) # display board
+            started = time.time()
 
-        if white: # get move either from AI or human
-            if turn_dict['white'] == 'user':
-                move = user_move(board)
-            else:
-                move = ai_move(board, white)
+            if white: # get move either from AI or human
+                if turn_dict['white'] == 'user':
+                    move = user_move(board)
+                else:
+                    move = bot_move(board, white, ponderer, clocks[white], increment)
 
-        else:
-            if turn_dict['black'] == 'user':
-                move = user_move(board)
             else:
-                move = ai_move(board, white)
+                if turn_dict['black'] == 'user':
+                    move = user_move(board)
+                else:
+                    move = bot_move(board, white, ponderer, clocks[white], increment)
 
-        try: # push the move
-            board.push_san(move)
-        except:
-            board.push(move)
+            try: # push the move
+                board.push_san(move)
+            except:
+                board.push(move)
 
-        if board.is_checkmate(): # check if game ends. Currently only limited to checkmate or tie game, but could potentially include more info.
-            print(board)
-            print ("White wins!") if white else print("Black wins!")
-            break
+            if clock is not None:
+                clocks[white] += increment - (time.time() - started)
+                print("White %.1f s, Black %.1f s" % (clocks[chess.WHITE], clocks[chess.BLACK]))
+                if clocks[white] < 0:
+                    print ("Black wins on time!") if white else print("White wins on time!")
+                    break
+
+            if board.is_checkmate(): # check if game ends. Currently only limited to checkmate or tie game, but could potentially include more info.
+                print(board)
+                print ("White wins!") if white else print("Black wins!")
+                break
+
+            elif board.is_game_over():
+                print(board)
+                print("Tie game")
+                break    
 
-        elif board.is_game_over():
-            print(board)
-            print("Tie game")
-            break    
-    
-        white = not white
+            if ponderer is not None and turn_dict['white' if white else 'black'] == 'bot':
+                ponderer.start(board, white) # think on the human's time
+            white = not white
+    finally:
+        if ponderer is not None: # the game may end on the human's move, with the ponderer still thinking
+            ponderer.stop()
 
 if __name__ == "__main__":
-    game() # run game
+    parser = argparse.ArgumentParser(description='Play against the AI.')
+    parser.add_argument('--clock', type=str, default=None, help='time control as seconds+increment, e.g. 300+0')
+    args = parser.parse_args()
+
+    if args.clock is None:
+        game() # run game
+    else:
+        base, increment = (args.clock.split('+') + ['0'])[:2]
+        game(float(base), float(increment))